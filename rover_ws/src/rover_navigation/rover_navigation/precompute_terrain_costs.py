@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import time
+import yaml
+
+from rover_navigation.utils.terrain_utils import (
+    GEOTIFF_PATH,
+    cost_sidecar_path,
+    load_cost_sidecar,
+    save_cost_sidecar,
+)
+
+
+def main(args=None):
+    """
+    Offline tool to precompute the terrain planner edge costs for every GeoTIFF map
+
+    Writes a .npz sidecar next to each map (keyed by a hash of the cost parameters) with float32
+    edge costs and a packed blocked-cell mask, which the terrainPathPlanner memory-maps instead of
+    recomputing the costs whenever it exists. Run it again after changing
+    the elevation/roll parameters or adding new maps (up-to-date sidecars are skipped).
+
+    Usage:
+      ros2 run rover_navigation precompute_terrain_costs
+      ros2 run rover_navigation precompute_terrain_costs --config config/navigation_params.yaml
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Precompute terrain planner edge costs for every GeoTIFF map."
+    )
+    parser.add_argument(
+        "--maps", type=str, default=GEOTIFF_PATH, help="Folder with the GeoTIFF maps."
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=None,
+        help="Navigation params file to read the state_machine cost parameters from.",
+    )
+    parser.add_argument("--elevation_cost", type=float, default=1.0)
+    parser.add_argument("--elevation_limit", type=float, default=0.7)
+    parser.add_argument("--roll_cost", type=float, default=0.2)
+    parser.add_argument("--roll_limit", type=float, default=1.4)
+    parser.add_argument(
+        "--force", action="store_true", help="Recompute sidecars even if they're up to date."
+    )
+    args = parser.parse_args(args)
+
+    params = {
+        "elevation_cost": args.elevation_cost,
+        "elevation_limit": args.elevation_limit,
+        "roll_cost": args.roll_cost,
+        "roll_limit": args.roll_limit,
+    }
+    if args.config:
+        with open(args.config) as f:
+            config = yaml.safe_load(f)["state_machine"]["ros__parameters"]
+        for name in params:
+            params[name] = config.get(name, params[name])
+    cost_params = (
+        params["elevation_cost"],
+        params["elevation_limit"],
+        params["roll_cost"],
+        params["roll_limit"],
+    )
+    print(f"Cost parameters: {params}")
+
+    geotiff_files = sorted(f for f in os.listdir(args.maps) if f.endswith(".tif"))
+    if not geotiff_files:
+        print(f"No GeoTIFF maps found in {args.maps}", file=sys.stderr)
+        sys.exit(1)
+
+    for file in geotiff_files:
+        geotiff_file = os.path.join(args.maps, file)
+        if not args.force and load_cost_sidecar(geotiff_file, *cost_params) is not None:
+            print(f"  {file}: up to date ({os.path.basename(cost_sidecar_path(geotiff_file, *cost_params))})")
+            continue
+
+        start_time = time.time()
+        sidecar_file = save_cost_sidecar(geotiff_file, *cost_params)
+        size_mb = os.path.getsize(sidecar_file) / (1024 * 1024)
+        print(
+            f"  {file}: wrote {os.path.basename(sidecar_file)} ({size_mb:.1f} MB, {time.time() - start_time:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
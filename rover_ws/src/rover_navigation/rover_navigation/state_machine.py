@@ -1,14 +1,12 @@
 import asyncio
+import math
 import rclpy
-import tf2_geometry_msgs
 import tf2_ros
 import time
-import utm
 from action_msgs.msg import GoalStatus
 from aruco_opencv_msgs.msg import ArucoDetection
 from builtin_interfaces.msg import Duration
 from enum import Enum, auto
-from geometry_msgs.msg import Pose, PoseStamped
 from lifecycle_msgs.srv import ChangeState, GetState
 from lifecycle_msgs.msg import Transition
 from nav2_msgs.action import FollowWaypoints, Spin
@@ -18,27 +16,53 @@ from rclpy.callback_groups import MutuallyExclusiveCallbackGroup, ReentrantCallb
 from rclpy.executors import MultiThreadedExecutor
 from rclpy.node import Node
 from rclpy.task import Future
+from rclpy.time import Time
 from rover_interfaces.action import AutonomyTask
 from sensor_msgs.msg import NavSatFix
 from std_srvs.srv import Trigger, SetBool
-from threading import RLock
+from threading import Event, Lock, RLock
 from typing import Any
 from zed_msgs.msg import ObjectsStamped
 
 
+from rover_navigation.utils.async_utils import (
+    AsyncLoopThread,  # one long-lived asyncio loop thread for all the async service and action calls
+    wrap_future,  # await an rclpy future without busy-spinning the loop
+)
+from rover_navigation.utils.detect_utils import (
+    TargetEstimator,  # fuses the aruco/object detections of a target into one UTM estimate
+    TransformCache,  # short-lived, non-blocking cache of the utm <- camera transforms
+    transform_points,  # apply a cached transform to a batch of positions at once
+)
 from rover_navigation.utils.gps_utils import (
     latLonYaw2Geopose,
-    meters2LatLon,
-    latLon2Meters,
+    MissionFrame,  # shared lat/lon, UTM, local meter and DEM pixel conversions for a task
 )
 from rover_navigation.utils.plan_utils import (
     basicPathPlanner,  # plan a straight path between two GPS coordinates
-    basicOrderPlanner,  # use brute force to find the best order of legs (based on distance)
+    orderPlanner,  # find the best order of legs (based on distance) with the selected order planner
+    leg_cost_matrix,  # straight line distances between the GPS fix and the legs
+    search_cost_matrix,  # expected spin and hex search costs of the legs
+    LegPlan,  # precomputed leg waypoint, hex search points and paths between them
+)
+from rover_navigation.utils.search_utils import (
+    searchPatternPlanner,  # generate a hex search pattern from the detection range and search radius
+    CoverageGrid,  # ground the camera has already seen around a search leg
 )
 from rover_navigation.utils.terrain_utils import (
     terrainPathPlanner,  # plan a path between two GPS coordinates using terrain data
+    terrainHexPlanner,  # plan terrain paths between all the hex search points of a leg at once
+    get_map_cache,  # process-wide cache of GeoTIFF maps and terrain graphs
+    terrainCostMatrix,  # terrain traversal costs between GPS locations (for order planning)
+    warm_cost_pool,  # starts the worker processes used by terrainCostMatrix
+    get_plan_pool,  # worker process for background terrainPathPlanner calls
+    warm_plan_pool,  # starts it ahead of time
 )
 
+MAX_WAKE_PERIOD = 1.0  # longest the state machine sleeps without an event (to check the timeouts)
+CANCEL_TIMEOUT = 2.0  # longest cancelTask waits for Nav2 to finish a canceled goal (in seconds)
+PREPLAN_TOLERANCE = 3.0  # how close we must be to where a background path was planned from (in meters)
+
 
 class State(Enum):
     INIT = auto()
@@ -136,11 +160,55 @@ class StateMachine(Node):
         self.declare_parameter("elevation_limit", 0.7)
         self.declare_parameter("roll_cost", 0.2)
         self.declare_parameter("roll_limit", 1.4)
+        self.declare_parameter("precompute_terrain_costs", False)
+        self.declare_parameter("use_grid_astar", False)
+        self.declare_parameter("terrain_cache_size_mb", 256)
+        self.declare_parameter("terrain_window_padding", 0.0)
+        self.declare_parameter("terrain_planner_mode", "standard")
+        self.declare_parameter("order_planner", "auto")
+        self.declare_parameter("use_terrain_order_costs", True)
+        self.declare_parameter("use_search_order_costs", True)
+        self.declare_parameter("use_preplanning", True)
         self.use_terrain_path_planner = self.get_parameter("use_terrain_path_planner").value
         self.elevation_cost = self.get_parameter("elevation_cost").value
         self.elevation_limit = self.get_parameter("elevation_limit").value
         self.roll_cost = self.get_parameter("roll_cost").value
         self.roll_limit = self.get_parameter("roll_limit").value
+        self.precompute_terrain_costs = self.get_parameter("precompute_terrain_costs").value
+        self.use_grid_astar = self.get_parameter("use_grid_astar").value
+        self.terrain_cache_size_mb = self.get_parameter("terrain_cache_size_mb").value
+        self.terrain_window_padding = self.get_parameter("terrain_window_padding").value
+        self.terrain_planner_mode = self.get_parameter("terrain_planner_mode").value
+        self.order_planner = self.get_parameter("order_planner").value
+        self.use_terrain_order_costs = self.get_parameter("use_terrain_order_costs").value
+        self.use_search_order_costs = self.get_parameter("use_search_order_costs").value
+        self.use_preplanning = self.get_parameter("use_preplanning").value
+
+        # Index the terrain maps once at startup (shared by every terrainPathPlanner call)
+        if self.use_terrain_path_planner:
+            get_map_cache(max_size_mb=self.terrain_cache_size_mb)
+            if self.use_terrain_order_costs:
+                # Spawn the leg ordering workers now, so the first task doesn't wait on them
+                warm_cost_pool(
+                    self.elevation_cost,
+                    self.elevation_limit,
+                    self.roll_cost,
+                    self.roll_limit,
+                    max_size_mb=self.terrain_cache_size_mb,
+                )
+
+        # Background worker process to plan the next path while we drive (the basic planner is
+        # instant, and the incremental planner already reuses its last search, so they don't need
+        # it). See get_plan_pool.
+        self.preplan_pool = None
+        self.preplan = None
+        if (
+            self.use_preplanning
+            and self.use_terrain_path_planner
+            and self.terrain_planner_mode != "incremental"
+        ):
+            warm_plan_pool(max_size_mb=self.terrain_cache_size_mb)  # spawn it and read the maps now
+            self.preplan_pool = get_plan_pool()
 
         # Tunable values
         self.declare_parameter("wait_time", 5)
@@ -150,6 +218,17 @@ class StateMachine(Node):
         self.declare_parameter("spin_wait_time", 0.5)
         self.declare_parameter("gps_nav_timeout", 210)
         self.declare_parameter("hex_nav_timeout", 45)
+        self.declare_parameter("detection_noise", 0.5)
+        self.declare_parameter("detection_drift", 0.05)
+        self.declare_parameter("tf_cache_max_age", 0.01)
+        self.declare_parameter("use_adaptive_search", True)
+        self.declare_parameter("detection_range", 5.0)
+        self.declare_parameter("aruco_search_radius", 20.0)
+        self.declare_parameter("obj_search_radius", 10.0)
+        self.declare_parameter("use_coverage_map", True)
+        self.declare_parameter("camera_frame", "zed_camera_link")
+        self.declare_parameter("camera_fov", 110.0)
+        self.declare_parameter("coverage_threshold", 0.95)
         self.wait_time = self.get_parameter("wait_time").value
         self.update_threshold = self.get_parameter("update_threshold").value
         self.waypoint_distance = self.get_parameter("waypoint_distance").value
@@ -157,6 +236,20 @@ class StateMachine(Node):
         self.spin_wait_time = self.get_parameter("spin_wait_time").value
         self.gps_nav_timeout = self.get_parameter("gps_nav_timeout").value
         self.hex_nav_timeout = self.get_parameter("hex_nav_timeout").value
+        self.detection_noise = self.get_parameter("detection_noise").value
+        self.detection_drift = self.get_parameter("detection_drift").value
+        self.tf_cache_max_age = self.get_parameter("tf_cache_max_age").value
+        self.use_adaptive_search = self.get_parameter("use_adaptive_search").value
+        self.detection_range = self.get_parameter("detection_range").value
+        self.aruco_search_radius = self.get_parameter("aruco_search_radius").value
+        self.obj_search_radius = self.get_parameter("obj_search_radius").value
+        self.use_coverage_map = self.get_parameter("use_coverage_map").value
+        self.camera_frame = self.get_parameter("camera_frame").value
+        self.camera_fov = math.radians(self.get_parameter("camera_fov").value)
+        self.coverage_threshold = self.get_parameter("coverage_threshold").value
+
+        # NOTE: These fixed patterns are only used if use_adaptive_search is false, otherwise the
+        # search patterns are generated for each leg by searchPatternPlanner (see search_pattern).
 
         # Assuming we can detect aruco tags up to 5m away, we've determined this is the best
         # search pattern for covering the 20m radius (fastest traversal, least overlap, most coverage).
@@ -203,15 +296,28 @@ class StateMachine(Node):
         # Object detection dict
         self.obj_to_label = {"mallet": "Class ID: 0", "bottle": "Class ID: 1"}
 
-        # UTM zone and hemisphere (will set on first gps fix)
-        self.zone = None
-        self.hemisphere = None
+        # Mission coordinate frame (will set from the first gps fix of each task)
+        self.frame = None
         self.filtered_gps = None
 
         # Initialize variables
         self.legs = []
         self.leg = None
         self.task_goal_handle = None
+        self.cancel_flag = False
+        self.coverage = None
+
+        # Wakes the state machine up when something happens (Nav2 results, cancel requests, detections)
+        self.wake_event = Event()
+
+        # Lets the detection callbacks preempt the active Nav2 goal (see preempt_helper)
+        self.preempt_lock = Lock()
+        self.cancel_future = None
+        self.nav_mode = None  # "search" (any detection preempts), "found" (only a moved target does)
+        self.nav_target = None
+
+        # Asyncio loop thread that runs every async helper (instead of asyncio.run() for each call)
+        self.async_loop = AsyncLoopThread("state_machine_async")
 
         #################################
         ### ROS 2 OBJECT DECLARATIONS ###
@@ -220,6 +326,7 @@ class StateMachine(Node):
         # Set up a Tf2 buffer for pose to GPS transforms (aruco, object)
         self.tf_buffer = tf2_ros.Buffer()
         self.tf_listener = tf2_ros.TransformListener(self.tf_buffer, self)
+        self.tf_cache = TransformCache(self.tf_buffer, "utm", self.tf_cache_max_age)
 
         # Callback groups (for threading)
         norm_callback_group = MutuallyExclusiveCallbackGroup()
@@ -367,7 +474,7 @@ class StateMachine(Node):
     async def followGpsWaypoints(self, gps_poses):
         """
         Function to follow a set of GPS waypoints, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: Call this with the async_loop.run() function
 
         IMPORTANT! In ROS2 Humble the Nav2 GPS waypoint follower is not avaliable.
         I've implemented a patch to use robot_localization to convert to poses Nav2 can go to.
@@ -376,20 +483,8 @@ class StateMachine(Node):
         https://github.com/ros-navigation/navigation2_tutorials/issues/77#issuecomment-1856414168
         """
 
-        converted_poses = []
-        for wp in gps_poses:
-            pose = PoseStamped()
-            pose.header.frame_id = "utm"
-            pose.header.stamp = self.get_clock().now().to_msg()
-            pose.pose.position.x = utm.from_latlon(
-                wp.position.latitude, wp.position.longitude
-            )[0]
-            pose.pose.position.y = utm.from_latlon(
-                wp.position.latitude, wp.position.longitude
-            )[1]
-            pose.pose.orientation = wp.orientation
-
-            converted_poses.append(pose)
+        # The WaypointPath already has the UTM coordinates, so this just builds the messages
+        converted_poses = gps_poses.to_poses(self.get_clock().now().to_msg())
 
         self.get_logger().info(
             f"Converted {len(gps_poses)} GPS waypoints to poses for Nav2"
@@ -420,7 +515,7 @@ class StateMachine(Node):
     async def followWaypoints(self, poses):
         """
         Function to follow a set of GPS waypoints, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: Call this with the async_loop.run() function
 
         https://github.com/ros-navigation/navigation2_tutorials/issues/77#issuecomment-1856414168
         """
@@ -436,14 +531,17 @@ class StateMachine(Node):
         send_goal_future = self.follow_waypoints_client.send_goal_async(
             goal_msg, self._feedbackCallback
         )
-        await send_goal_future  # fix for iron/humble threading bug
-        self.goal_handle = send_goal_future.result()
+        await wrap_future(send_goal_future)  # fix for iron/humble threading bug
+        with self.preempt_lock:
+            self.goal_handle = send_goal_future.result()
+            self.cancel_future = None
 
         if not self.goal_handle.accepted:
             self.error(f"Following {len(poses)} waypoints request was rejected!")
             return False
 
         self.result_future = self.goal_handle.get_result_async()
+        self.result_future.add_done_callback(self._resultCallback)
         return True
 
     async def spin(
@@ -451,7 +549,7 @@ class StateMachine(Node):
     ):
         """
         Function to spin in place, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: Call this with the async_loop.run() function
         """
 
         self.debug("Waiting for 'Spin' action server")
@@ -472,64 +570,77 @@ class StateMachine(Node):
         send_goal_future = self.spin_client.send_goal_async(
             goal_msg, self._feedbackCallback
         )
-        await send_goal_future  # fix for iron/humble threading bug
-        self.goal_handle = send_goal_future.result()
+        await wrap_future(send_goal_future)  # fix for iron/humble threading bug
+        with self.preempt_lock:
+            self.goal_handle = send_goal_future.result()
+            self.cancel_future = None
 
         if not self.goal_handle.accepted:
             self.error("Spin request was rejected!")
             return False
 
         self.result_future = self.goal_handle.get_result_async()
+        self.result_future.add_done_callback(self._resultCallback)
         return True
 
     async def cancelTask(self):
         """
         Cancel pending task request of any type, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: Call this with the async_loop.run() function
         """
 
         self.info("Canceling current task.")
+        self.nav_mode = None
         if self.result_future:
-            future = self.goal_handle.cancel_goal_async()
-            await future  # fix for iron/humble threading bug
-        time.sleep(0.5)  # fix for bug, give time to cancel
+            # Use the cancel request a detection callback already sent, if there is one
+            with self.preempt_lock:
+                if self.cancel_future is None:
+                    self.cancel_future = self.goal_handle.cancel_goal_async()
+                future = self.cancel_future
+            await wrap_future(future)  # fix for iron/humble threading bug
+
+            # Wait for Nav2 to actually finish the goal (instead of a fixed sleep)
+            try:
+                await asyncio.wait_for(wrap_future(self.result_future), timeout=CANCEL_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.warn("Timed out waiting for the canceled task to finish")
         return
 
-    async def isTaskComplete(self):
+    def isTaskComplete(self):
         """
         Check if the task request of any type is complete yet, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: This doesn't block, use wait_for_wake() between checks (the result wakes it up)
         """
 
         if not self.result_future:
             # task was cancelled or completed
             return True
 
-        # Fix for iron/humble threading bug (with timeout)
-        # https://docs.python.org/3/library/asyncio-task.html#asyncio.wait_for
-        try:
-            await asyncio.wait_for(self.isTaskCompleteHelper(), timeout=0.1)
-        except asyncio.TimeoutError:
-            self.debug("Timed out waiting for async future to complete")
-
-        if self.result_future.result():
-            self.status = self.result_future.result().status
-            if self.status != GoalStatus.STATUS_SUCCEEDED:
-                self.error(f"Task with failed with status code: {self.status}")
-                return True
-        else:
-            # Timed out, still processing, not complete yet
+        if not self.result_future.done():
+            # Still processing, not complete yet
             return False
 
+        result = self.result_future.result()
+        if result is None:
+            self.error("Task finished without a result")
+            self.status = GoalStatus.STATUS_UNKNOWN
+            return True
+
+        self.status = result.status
+        if self.status != GoalStatus.STATUS_SUCCEEDED:
+            self.error(f"Task with failed with status code: {self.status}")
+            return True
+
         self.debug("Task succeeded!")
         return True
 
-    async def isTaskCompleteHelper(self):
+    def wait_for_wake(self, timeout=MAX_WAKE_PERIOD):
         """
-        Helper function for async 'wait_for' wrapping
+        Block the state machine until something wakes it up (or the timeout passes)
         """
 
-        await self.result_future
+        self.wake_event.wait(timeout)
+        self.wake_event.clear()
 
     def getFeedback(self):
         """
@@ -558,17 +669,17 @@ class StateMachine(Node):
         """
 
         if localizer != "robot_localization":  # non-lifecycle node
-            asyncio.run(self._waitForNodeToActivate(localizer))
+            self.async_loop.run(self._waitForNodeToActivate(localizer))
         if localizer == "amcl":
             self._waitForInitialPose()
-        asyncio.run(self._waitForNodeToActivate(navigator))
+        self.async_loop.run(self._waitForNodeToActivate(navigator))
         self.info("Nav2 is ready for use!")
         return
 
     async def _waitForNodeToActivate(self, node_name):
         """
         Waits for the node within the tester namespace to become active, based on the nav2_simple_commander code
-        NOTE: Call this with the asyncio.run() function
+        NOTE: Call this with the async_loop.run() function
         """
 
         self.debug(f"Waiting for {node_name} to become active..")
@@ -586,11 +697,11 @@ class StateMachine(Node):
                 self.task_warn("Waiting for Nav2 to activate...")
             self.debug(f"Getting {node_name} state...")
             future = state_client.call_async(req)
-            await future  # fix for iron/humble threading bug
+            await wrap_future(future)  # fix for iron/humble threading bug
             if future.result() is not None:
                 state = future.result().current_state.label
                 self.debug(f"Result of get_state: {state}")
-            time.sleep(2)
+            await asyncio.sleep(2)
         return
 
     def _feedbackCallback(self, msg):
@@ -598,6 +709,11 @@ class StateMachine(Node):
         self.feedback = msg.feedback
         return
 
+    def _resultCallback(self, future):
+        self.debug("Received action result message")
+        self.wake_event.set()
+        return
+
     def info(self, msg):
         self.get_logger().info(msg)
         return
@@ -628,16 +744,24 @@ class StateMachine(Node):
         """
 
         self.cancel_flag = True
+        self.wake_event.set()
         return CancelResponse.ACCEPT
 
     async def async_service_call(self, client, request):
         """
         Fix for iron/humble threading bug - https://github.com/ros2/rclpy/issues/1337
-        NOTE: Call this with the asyncio.run() function (and all other async functions)
+        NOTE: Call this with the service_call() function
         """
 
         future = client.call_async(request)
-        await future
+        await wrap_future(future)
+
+    def service_call(self, client, request):
+        """
+        Call a service on the asyncio loop thread and block until it responds
+        """
+
+        self.async_loop.run(self.async_service_call(client, request), client.srv_name)
 
     def action_server_callback(self, goal_handle):
         """
@@ -657,7 +781,7 @@ class StateMachine(Node):
             return result
 
         # Trigger the autonomy state
-        asyncio.run(self.async_service_call(self.auto_client, self.auto_request))
+        self.service_call(self.auto_client, self.auto_request)
 
         try:
             self.run_state_machine()
@@ -670,18 +794,22 @@ class StateMachine(Node):
             if self.leg.type == "obj":
                 self.task_info("Disabling object detection")
                 self.obj_request.data = False
-                asyncio.run(self.async_service_call(self.obj_client, self.obj_request))
+                self.service_call(self.obj_client, self.obj_request)
             elif self.leg.type == "aruco":
                 self.task_info("Disabling aruco detection")
                 self.aruco_request.transition.id = Transition.TRANSITION_DEACTIVATE
-                asyncio.run(self.async_service_call(self.aruco_client, self.aruco_request))
+                self.service_call(self.aruco_client, self.aruco_request)
             self.leg = None
 
             result.msg = "It's gotta be the aliens, I'm telling you"
             self.task_goal_handle.abort()
 
         # Trigger the teleop state
-        asyncio.run(self.async_service_call(self.teleop_client, self.teleop_request))
+        self.service_call(self.teleop_client, self.teleop_request)
+
+        # Report the service and action round trip latencies (across all the tasks so far)
+        for line in self.async_loop.latency.summary():
+            self.get_logger().info("Latency " + line)
 
         self.task_goal_handle = None
         return result
@@ -691,41 +819,62 @@ class StateMachine(Node):
         Callback function for the GPS subscriber
         """
 
-        # Set zone and hemisphere for UTM conversions
-        if self.zone is None or self.hemisphere is None:
-            self.zone = utm.from_latlon(msg.latitude, msg.longitude)[2]
-            self.hemisphere = utm.from_latlon(msg.latitude, msg.longitude)[3]
-
         self.filtered_gps = latLonYaw2Geopose(msg.latitude, msg.longitude)
 
-    def pose_to_geopose(self, pose, frame_id, stamp):
+        # Mark what the camera can see from here on the search coverage map
+        coverage = self.coverage
+        if coverage is not None:
+            try:
+                tf = self.tf_buffer.lookup_transform("utm", self.camera_frame, Time())
+            except Exception:
+                return  # don't block or warn, we'll get the next one
+            q = tf.transform.rotation
+            yaw = math.atan2(2.0 * (q.w * q.z + q.x * q.y), 1.0 - 2.0 * (q.y * q.y + q.z * q.z))
+            coverage.add_view(
+                tf.transform.translation.x,
+                tf.transform.translation.y,
+                yaw,
+                self.camera_fov,
+                self.detection_range,
+            )
+
+    def positions_to_utm(self, positions, frame_id, stamp):
         """
-        Convert a pose to a geopose we can navigate to
+        Convert a batch of (x, y, z) positions to UTM (east, north) coordinates
         """
 
-        # Look up and use the transform to convert the pose to UTM
-        try:
-            wait_timeout = rclpy.duration.Duration(seconds=1.0) # bug fix for future extrapolation error
-            tf = self.tf_buffer.lookup_transform("utm", frame_id, stamp, timeout=wait_timeout)
-            utm_pose = tf2_geometry_msgs.do_transform_pose(pose, tf)
-        except Exception as e:
-            self.get_logger().warn(f"Could not transform pose: {e}")
+        # One cached, non-blocking transform lookup for the whole batch
+        tf = self.tf_cache.lookup(frame_id, stamp)
+        if tf is None:
+            self.get_logger().warn(
+                f"Could not transform poses from {frame_id}", throttle_duration_sec=1.0
+            )
             return False
 
+        return transform_points(tf, positions)[:, :2].tolist()
+
+    def fuse_detection(self, east, north, confidence=1.0):
+        """
+        Fuse a detection (in UTM) into the leg's target estimate and update the found pose from it
+        """
+
         # Check to make sure we've had at least one GPS fix
-        if self.filtered_gps is None:
+        if self.frame is None:
             self.get_logger().error("No filtered GPS fix available for UTM conversion")
-            return False
+            return
 
-        # Given UTM pose, convert to GPS
-        lat, lon = utm.to_latlon(
-            utm_pose.position.x,
-            utm_pose.position.y,
-            self.zone,
-            self.hemisphere,
-        )
+        estimator = self.found_estimators.get(self.leg.name)
+        if estimator is None:
+            estimator = TargetEstimator(self.detection_noise, self.detection_drift)
+            self.found_estimators[self.leg.name] = estimator
+        if not estimator.update(east, north, confidence):
+            self.get_logger().info("Ignoring an outlier detection")
+            return
 
-        return latLonYaw2Geopose(lat, lon)
+        # Given the fused UTM estimate, convert to GPS
+        lat, lon = self.frame.utm_to_latlon(*estimator.position)
+        self.found_poses[self.leg.name] = latLonYaw2Geopose(lat, lon)
+        self.preempt_helper()
 
     def aruco_callback(self, msg):
         """
@@ -736,20 +885,24 @@ class StateMachine(Node):
             return
 
         if self.leg.type == "aruco":
-            for marker in msg.markers:
-                # Are we looking for this marker right now?
-                if marker.marker_id == self.leg.tag_id:
+            # Are we looking for any of these markers right now?
+            positions = [
+                (marker.pose.position.x, marker.pose.position.y, marker.pose.position.z)
+                for marker in msg.markers
+                if marker.marker_id == self.leg.tag_id
+            ]
+            if not positions:
+                return
 
-                    self.get_logger().info(f"Found aruco tag {marker.marker_id}")
+            self.get_logger().info(f"Found aruco tag {self.leg.tag_id}")
 
-                    # Convert the pose to a GeoPose
-                    geopose = self.pose_to_geopose(
-                        marker.pose, msg.header.frame_id, msg.header.stamp
-                    )
+            # Convert them all to UTM (with one transform lookup)
+            utm_positions = self.positions_to_utm(positions, msg.header.frame_id, msg.header.stamp)
 
-                    # If it was successful, store it
-                    if geopose:
-                        self.found_poses[self.leg.name] = geopose
+            # If it was successful, fuse them into the estimate
+            if utm_positions:
+                for east, north in utm_positions:
+                    self.fuse_detection(east, north)
 
     def obj_callback(self, msg):
         """
@@ -760,30 +913,22 @@ class StateMachine(Node):
             return
 
         if self.leg.type == "obj":
-            for obj in msg.objects:
-                # Are we looking for this object right now?
-                if obj.label == self.obj_to_label[self.leg.object]:
-
-                    self.get_logger().info(f"Found object {obj.label}")
-
-                    # Convert to a Pose() message
-                    pose = Pose()
-                    pose.position.x = float(obj.position[0])
-                    pose.position.y = float(obj.position[1])
-                    pose.position.z = float(obj.position[2])
-                    pose.orientation.x = 0.0
-                    pose.orientation.y = 0.0
-                    pose.orientation.z = 0.0
-                    pose.orientation.w = 1.0
-
-                    # Convert the pose to a GeoPose
-                    geopose = self.pose_to_geopose(
-                        pose, msg.header.frame_id, msg.header.stamp
-                    )
+            # Are we looking for any of these objects right now?
+            label = self.obj_to_label[self.leg.object]
+            objects = [obj for obj in msg.objects if obj.label == label]
+            if not objects:
+                return
+
+            self.get_logger().info(f"Found object {label}")
+
+            # Convert them all to UTM (with one transform lookup)
+            positions = [[float(value) for value in obj.position[:3]] for obj in objects]
+            utm_positions = self.positions_to_utm(positions, msg.header.frame_id, msg.header.stamp)
 
-                    # If it was successful, store it
-                    if geopose:
-                        self.found_poses[self.leg.name] = geopose
+            # If it was successful, fuse them into the estimate (ZED confidences are 0-100)
+            if utm_positions:
+                for (east, north), obj in zip(utm_positions, objects):
+                    self.fuse_detection(east, north, obj.confidence / 100.0)
 
     ###########################
     ### END ROS 2 CALLBACKS ###
@@ -856,41 +1001,48 @@ class StateMachine(Node):
     ### HELPER FUNCTIONS ###
     ########################
 
-    def navigate_helper(self, dest_wp, hex_mode=False, found_mode=False):
+    def navigate_helper(self, dest_wp, hex_mode=False, found_mode=False, path=None):
         """
         Helper waypoint navigation function that integrates with Nav2
         """
 
-        # 1. Generate a path to the destination waypoint
-        if self.use_terrain_path_planner:
-            path = terrainPathPlanner(self.filtered_gps, dest_wp, self.waypoint_distance, self.elevation_cost, self.elevation_limit, self.roll_cost, self.roll_limit)
+        # 1. Generate a path to the destination waypoint (unless it was already planned)
+        if path is None:
+            path = self.take_preplan_helper(dest_wp)
         else:
-            path = basicPathPlanner(self.filtered_gps, dest_wp, self.waypoint_distance)
+            self.discard_preplan_helper()
+        if path is None:
+            path = self.plan_path(self.filtered_gps, dest_wp)
 
         # 2. Publish the GPS positions to mapviz
-        for wp in path:
+        for i, (lat, lon) in enumerate(zip(path.lat.tolist(), path.lon.tolist())):
             navsat_fix = NavSatFix()
             navsat_fix.header.frame_id = "map"
             navsat_fix.header.stamp = self.get_clock().now().to_msg()
-            navsat_fix.latitude = wp.position.latitude
-            navsat_fix.longitude = wp.position.longitude
+            navsat_fix.latitude = lat
+            navsat_fix.longitude = lon
 
-            # 2.1 Publish to different topics based on type
-            if wp != dest_wp:
+            # 2.1 Publish to different topics based on type (the path always ends at the goal)
+            if i < len(path) - 1:
                 self.mapviz_inter_publisher.publish(navsat_fix)
             else:
                 self.mapviz_goal_publisher.publish(navsat_fix)
             time.sleep(0.1)  # give time to publish
 
-        # 3. Follow the determined path
-        asyncio.run(self.followGpsWaypoints(path))
+        # 3. Follow the determined path (detections can preempt it from the callbacks)
+        self.nav_target = dest_wp
+        self.nav_mode = "found" if found_mode else "search"
+        self.async_loop.run(self.followGpsWaypoints(path), "followGpsWaypoints goal accept")
+
+        # 3.0 Plan the path after this one in the background while we drive
+        self.preplan_helper(dest_wp, hex_mode, found_mode)
         start_time = self.get_clock().now().to_msg()
-        while not asyncio.run(self.isTaskComplete()):
-            time.sleep(0.1)
+        while not self.isTaskComplete():
+            self.wait_for_wake()  # returns as soon as there's a result, cancel request or detection
 
             # 3.1 Check if the goal has been canceled
-            if self.task_goal_handle.is_cancel_requested:
-                asyncio.run(self.cancelTask())
+            if self.cancel_flag or self.task_goal_handle.is_cancel_requested:
+                self.async_loop.run(self.cancelTask())
                 raise Exception("Task execution canceled by action client")
 
             # 3.2 Check if we've spent too long on this waypoint and should move on
@@ -900,7 +1052,7 @@ class StateMachine(Node):
                     > self.gps_nav_timeout
                 ):
                     self.task_warn("GPS navigation timed out")
-                    asyncio.run(self.cancelTask())
+                    self.async_loop.run(self.cancelTask())
                     return Result.FAILED
             elif hex_mode:  # we're navigating to a hex waypoint
                 if (
@@ -908,34 +1060,33 @@ class StateMachine(Node):
                     > self.hex_nav_timeout
                 ):
                     self.task_warn("Hex navigation timed out")
-                    asyncio.run(self.cancelTask())
+                    self.async_loop.run(self.cancelTask())
                     return Result.FAILED
 
             # 3.3 Check for the object or aruco tag while navigating
             if found_mode:  # we're navigating to a found object
                 # Check if we get a better object or tag location as we get closer
-                if (
-                    latLon2Meters(
-                        self.found_poses[self.leg.name].position.latitude,
-                        self.found_poses[self.leg.name].position.longitude,
-                        dest_wp.position.latitude,
-                        dest_wp.position.longitude,
-                    )
-                    > self.update_threshold
-                ):
-                    asyncio.run(self.cancelTask())
+                if self.found_moved_helper(dest_wp):
+                    self.async_loop.run(self.cancelTask())
                     return Result.FOUND
             else:  # we're navigating to a GPS or hex waypoint
                 # Check for the aruco tag or object while navigating
                 if self.found_helper():
-                    asyncio.run(self.cancelTask())
+                    self.async_loop.run(self.cancelTask())
                     return Result.FOUND
 
+        self.nav_mode = None
         result = self.getResult()
         if result == TaskResult.SUCCEEDED:
             return Result.SUCCEEDED
-        else:
-            return Result.FAILED
+
+        # 4. A detection can cancel the goal from the callbacks before the loop checks for it
+        if found_mode:
+            if self.found_moved_helper(dest_wp):
+                return Result.FOUND
+        elif self.found_helper():
+            return Result.FOUND
+        return Result.FAILED
 
     def spin_helper(self):
         """
@@ -945,23 +1096,29 @@ class StateMachine(Node):
         # 1. Calculate the angle
         adj_spin_distance = 6.28 / self.spin_stops
 
-        # 2. Spin to the calculated angle
-        asyncio.run(self.spin(spin_dist=adj_spin_distance))
-        while not asyncio.run(self.isTaskComplete()):
-            time.sleep(0.1)
+        # 2. Spin to the calculated angle (detections can preempt it from the callbacks)
+        self.nav_mode = "search"
+        self.async_loop.run(self.spin(spin_dist=adj_spin_distance), "spin goal accept")
+        while not self.isTaskComplete():
+            self.wait_for_wake()  # returns as soon as there's a result, cancel request or detection
 
             # 2.1 Check if the goal has been canceled
-            if self.task_goal_handle.is_cancel_requested:
-                asyncio.run(self.cancelTask())
+            if self.cancel_flag or self.task_goal_handle.is_cancel_requested:
+                self.async_loop.run(self.cancelTask())
                 raise Exception("Task execution canceled by action client")
 
             # 2.2 Check for the aruco tag or object while spinning
             if self.found_helper():
-                asyncio.run(self.cancelTask())
+                self.async_loop.run(self.cancelTask())
                 return Result.FOUND
+        self.nav_mode = None
 
-        # 3. Wait a designated amount of time to get a good picture
-        time.sleep(self.spin_wait_time)
+        # 3. Wait a designated amount of time to get a good picture (unless we see it first)
+        wait_end = time.monotonic() + self.spin_wait_time
+        while time.monotonic() < wait_end:
+            if self.found_helper():
+                return Result.FOUND
+            self.wait_for_wake(wait_end - time.monotonic())
 
         result = self.getResult()
         if result == TaskResult.SUCCEEDED:
@@ -983,6 +1140,158 @@ class StateMachine(Node):
                 return False
         return False
 
+    def plan_path(self, start_wp, dest_wp):
+        """
+        Helper function to plan a path between two GPS waypoints with the selected path planner
+        """
+
+        if self.use_terrain_path_planner:
+            return terrainPathPlanner(*self.terrain_plan_args(start_wp, dest_wp))
+        return basicPathPlanner(start_wp, dest_wp, self.waypoint_distance, self.frame)
+
+    def terrain_plan_args(self, start_wp, dest_wp):
+        """
+        Helper function to get the terrainPathPlanner arguments for a path between two GPS waypoints
+        """
+
+        return (start_wp, dest_wp, self.waypoint_distance, self.elevation_cost, self.elevation_limit, self.roll_cost, self.roll_limit, self.precompute_terrain_costs, self.use_grid_astar, self.terrain_window_padding, self.terrain_planner_mode, self.frame)
+
+    def next_waypoint_helper(self, hex_mode, found_mode):
+        """
+        Helper function to guess the waypoint we'll navigate to after the current one (or None)
+        """
+
+        if hex_mode and self.hex_cntr < len(self.leg_plan.hex_wps):
+            # The next hex point (unless its path is already in the leg plan)
+            if self.leg_plan.hex_path(self.hex_cntr, self.hex_cntr) is not None:
+                return None
+            return self.leg_plan.hex_wps.geopose(self.hex_cntr)
+        if not hex_mode and not found_mode and self.leg.type != "gps":
+            return None  # we'll search here next (the first hex path is in the leg plan)
+        if self.leg_cntr < len(self.legs):
+            return self.leg_plans[self.legs[self.leg_cntr].name].leg_wp
+        return None
+
+    def preplan_helper(self, dest_wp, hex_mode, found_mode):
+        """
+        Helper function to start planning the path to the next likely waypoint in the background
+
+        It's planned from the current destination, so it's only used if we actually get there.
+        """
+
+        self.discard_preplan_helper()
+        if self.preplan_pool is None:
+            return
+
+        next_wp = self.next_waypoint_helper(hex_mode, found_mode)
+        if next_wp is not None:
+            future = self.preplan_pool.submit(terrainPathPlanner, *self.terrain_plan_args(dest_wp, next_wp))
+            self.preplan = (dest_wp, next_wp, future)
+
+    def take_preplan_helper(self, dest_wp):
+        """
+        Helper function to get the background planned path to dest_wp, if it's from where we are
+        """
+
+        if self.preplan is None:
+            return None
+        start_wp, next_wp, future = self.preplan
+        self.preplan = None
+
+        # Was it planned to this destination, from about where we are now?
+        if (
+            next_wp.position.latitude != dest_wp.position.latitude
+            or next_wp.position.longitude != dest_wp.position.longitude
+            or self.frame.distance(
+                start_wp.position.latitude,
+                start_wp.position.longitude,
+                self.filtered_gps.position.latitude,
+                self.filtered_gps.position.longitude,
+            )
+            > PREPLAN_TOLERANCE
+        ):
+            future.cancel()
+            return None
+
+        try:
+            path = future.result()  # usually done already, otherwise it's still the quickest way
+        except Exception as e:
+            self.task_warn("Background path planning failed: " + str(e))
+            return None
+        self.task_info("Using the path planned in the background")
+        return path
+
+    def discard_preplan_helper(self):
+        """
+        Helper function to throw away the background planned path (if it hasn't started, stop it)
+        """
+
+        if self.preplan is not None:
+            self.preplan[2].cancel()
+            self.preplan = None
+
+    def search_pattern(self, leg_type, heading=0.0):
+        """
+        Helper function to get the hex search pattern for a leg type (approached at heading)
+        """
+
+        if leg_type != "aruco" and leg_type != "obj":
+            return ()
+        if not self.use_adaptive_search:
+            return self.hex_coord_aruco if leg_type == "aruco" else self.hex_coord_obj
+
+        radius = self.aruco_search_radius if leg_type == "aruco" else self.obj_search_radius
+        return searchPatternPlanner(radius, self.detection_range, heading)
+
+    def coverage_helper(self, utm_x, utm_y):
+        """
+        Helper function to check if the camera has already seen the area around a search point
+        """
+
+        if self.coverage is None:
+            return False
+        coverage = self.coverage.coverage(utm_x, utm_y, self.detection_range)
+        return coverage >= self.coverage_threshold
+
+    def found_moved_helper(self, dest_wp):
+        """
+        Helper function to check if the object or aruco tag location moved away from dest_wp
+        """
+
+        found_pose = self.found_poses[self.leg.name]
+        return (
+            self.frame.distance(
+                found_pose.position.latitude,
+                found_pose.position.longitude,
+                dest_wp.position.latitude,
+                dest_wp.position.longitude,
+            )
+            > self.update_threshold
+        )
+
+    def preempt_helper(self):
+        """
+        Helper function to preempt the active Nav2 goal right from a detection callback
+
+        Sends the cancel request immediately (cancelTask picks it up) and wakes the state machine,
+        instead of waiting for the state machine to notice the detection first.
+        """
+
+        with self.preempt_lock:
+            active = (
+                self.goal_handle is not None
+                and self.result_future is not None
+                and not self.result_future.done()
+                and self.cancel_future is None
+            )
+            if active and (
+                self.nav_mode == "search"
+                or (self.nav_mode == "found" and self.found_moved_helper(self.nav_target))
+            ):
+                self.get_logger().info("Preempting the active Nav2 goal")
+                self.cancel_future = self.goal_handle.cancel_goal_async()
+        self.wake_event.set()
+
     ############################
     ### END HELPER FUNCTIONS ###
     ############################
@@ -1030,33 +1339,98 @@ class StateMachine(Node):
 
         # Initialize variables
         self.found_poses = {}
+        self.found_estimators = {}
         self.leg_cntr = 0
         self.hex_cntr = 0
-        self.coord = None
+        self.leg_plans = {}
+        self.leg_plan = None
+        self.hex_source = None
+        self.discard_preplan_helper()
 
         # Check for the first GPS fix
         while self.filtered_gps is None:
-            time.sleep(1)
+            self.wait_for_wake()
             self.task_warn("Waiting on a GPS fix...")
 
             # Check if the goal has been canceled
-            if self.task_goal_handle.is_cancel_requested:
-                asyncio.run(self.cancelTask())
+            if self.cancel_flag or self.task_goal_handle.is_cancel_requested:
+                self.async_loop.run(self.cancelTask())
                 raise Exception("Task execution canceled by action client")
 
+        # Anchor the mission coordinate frame at the first fix
+        self.frame = MissionFrame.from_geopose(self.filtered_gps)
+
         # Report which order and path planners are selected
-        self.task_info("Order planner: basicOrderPlanner")
+        self.task_info("Order planner: orderPlanner (" + self.order_planner + ")")
         if self.use_terrain_path_planner:
-            self.task_info("Path planner: terrainPathPlanner")
+            self.task_info("Path planner: terrainPathPlanner (" + self.terrain_planner_mode + ")")
         else:
             self.task_info("Path planner: basicPathPlanner")
 
         # Determine the best order for the legs
-        self.legs = basicOrderPlanner(self.legs, self.filtered_gps)
+        cost_matrix = leg_cost_matrix(self.legs, self.filtered_gps, self.frame)
+        if self.use_terrain_path_planner and self.use_terrain_order_costs:
+            leg_wps = [self.filtered_gps]
+            for leg in self.legs:
+                leg_wps.append(latLonYaw2Geopose(leg.latitude, leg.longitude))
+            try:
+                cost_matrix = terrainCostMatrix(
+                    leg_wps,
+                    cost_matrix,
+                    self.elevation_cost,
+                    self.elevation_limit,
+                    self.roll_cost,
+                    self.roll_limit,
+                    frame=self.frame,
+                )
+            except Exception as e:
+                self.task_warn("Terrain order costs failed, using straight line distances: " + str(e))
+        search_patterns = {"aruco": self.search_pattern("aruco"), "obj": self.search_pattern("obj")}
+        if self.use_search_order_costs:
+            cost_matrix = cost_matrix + search_cost_matrix(
+                self.legs,
+                self.filtered_gps,
+                search_patterns,
+                self.spin_stops,
+                frame=self.frame,
+            )
+        self.legs = orderPlanner(self.legs, self.filtered_gps, self.order_planner, cost_matrix, self.frame)
 
         order = [leg.name for leg in self.legs]
         self.task_info("Determined best leg order: " + str(order))
 
+        # Precompute the leg waypoints, hex search points and the paths between them
+        prev_x, prev_y = self.frame.latlon_to_utm(
+            self.filtered_gps.position.latitude, self.filtered_gps.position.longitude
+        )
+        for leg in self.legs:
+            # Generate the search pattern for the heading we'll approach the leg from
+            leg_x, leg_y = self.frame.latlon_to_utm(leg.latitude, leg.longitude)
+            heading = math.atan2(leg_y - prev_y, leg_x - prev_x)
+            prev_x, prev_y = leg_x, leg_y
+
+            # Straight hex paths only for the basic planner, the terrain planner's paths are batch
+            # planned below (any it doesn't plan are left None, so plan_path plans them on the way)
+            wp_dist = None if self.use_terrain_path_planner else self.waypoint_distance
+            leg_plan = LegPlan(leg, self.frame, self.search_pattern(leg.type, heading), wp_dist)
+            if self.use_terrain_path_planner and len(leg_plan.hex_wps) > 0:
+                try:
+                    leg_plan.hex_paths = terrainHexPlanner(
+                        leg_plan.leg_wp,
+                        list(leg_plan.hex_wps),
+                        self.waypoint_distance,
+                        self.elevation_cost,
+                        self.elevation_limit,
+                        self.roll_cost,
+                        self.roll_limit,
+                        self.terrain_window_padding,
+                        self.frame,
+                    )
+                except Exception as e:
+                    self.task_warn("Hex path batch planning failed for " + leg.name + ": " + str(e))
+            self.leg_plans[leg.name] = leg_plan
+        self.task_info("Planned " + str(len(self.leg_plans)) + " legs")
+
         # Make sure the navigation stack is up and running
         self.waitUntilNav2Active(localizer="robot_localization")
 
@@ -1070,24 +1444,34 @@ class StateMachine(Node):
         # Have we completed all the legs?
         if self.leg_cntr >= len(self.legs):
             self.leg = None
+            self.coverage = None
             self.task_info("Autonomy task completed")
             self.complete_flag = True
             return
 
         self.leg = self.legs[self.leg_cntr]
+        self.leg_plan = self.leg_plans[self.leg.name]
         self.leg_cntr += 1
 
         self.hex_cntr = 0  # reset the hex counter
 
+        # Start a new coverage map around the leg (it's updated from the GPS callback)
+        self.coverage = None
+        if self.use_coverage_map and len(self.leg_plan.hex_wps) > 0:
+            radius = self.aruco_search_radius if self.leg.type == "aruco" else self.obj_search_radius
+            self.coverage = CoverageGrid(
+                self.leg_plan.utm_x, self.leg_plan.utm_y, radius + self.detection_range
+            )
+
         # Enable aruco/object detection
         if self.leg.type == "obj":
             self.task_info("Enabling object detection")
             self.obj_request.data = True
-            asyncio.run(self.async_service_call(self.obj_client, self.obj_request))
+            self.service_call(self.obj_client, self.obj_request)
         elif self.leg.type == "aruco":
             self.task_info("Enabling aruco detection")
             self.aruco_request.transition.id = Transition.TRANSITION_ACTIVATE
-            asyncio.run(self.async_service_call(self.aruco_client, self.aruco_request))
+            self.service_call(self.aruco_client, self.aruco_request)
 
         self.state = State.GPS_NAV
 
@@ -1098,8 +1482,7 @@ class StateMachine(Node):
 
         self.task_info("Starting GPS navigation")
 
-        leg_wp = latLonYaw2Geopose(self.leg.latitude, self.leg.longitude)
-        nav_result = self.navigate_helper(leg_wp)
+        nav_result = self.navigate_helper(self.leg_plan.leg_wp)
 
         if nav_result == Result.SUCCEEDED:
 
@@ -1117,11 +1500,11 @@ class StateMachine(Node):
             if self.leg.type == "obj":
                 self.task_info("Disabling object detection")
                 self.obj_request.data = False
-                asyncio.run(self.async_service_call(self.obj_client, self.obj_request))
+                self.service_call(self.obj_client, self.obj_request)
             elif self.leg.type == "aruco":
                 self.task_info("Disabling aruco detection")
                 self.aruco_request.transition.id = Transition.TRANSITION_DEACTIVATE
-                asyncio.run(self.async_service_call(self.aruco_client, self.aruco_request))
+                self.service_call(self.aruco_client, self.aruco_request)
 
             self.state = State.NEXT_LEG
         elif nav_result == Result.FOUND:
@@ -1133,6 +1516,12 @@ class StateMachine(Node):
         Function to handle the spin search state
         """
 
+        # Did we already see everything around the waypoint on the way in?
+        if self.coverage_helper(self.leg_plan.utm_x, self.leg_plan.utm_y):
+            self.task_info("Skipping spin search (area already covered)")
+            self.state = State.NEXT_HEX
+            return
+
         self.task_info("Starting spin search")
 
         success_cnt = 0
@@ -1180,21 +1569,24 @@ class StateMachine(Node):
         Function to handle the next hex state
         """
 
-        if self.leg.type == "aruco":
-            self.hex_coord = self.hex_coord_aruco
-        elif self.leg.type == "obj":
-            self.hex_coord = self.hex_coord_obj
-
         # Have we completed all the hex points?
-        if self.hex_cntr >= len(self.hex_coord):
+        if self.hex_cntr >= len(self.leg_plan.hex_wps):
             self.task_info("Hex search completed")
             self.task_error("Failed to find the object/tag")
             self.state = State.NEXT_LEG
             return
 
-        self.coord = self.hex_coord[self.hex_cntr]
+        if self.hex_cntr == 0:
+            self.hex_source = 0  # the first hex paths start at the leg waypoint
+
         self.hex_cntr += 1
 
+        # Skip hex points whose surroundings the camera has already seen
+        hex_wps = self.leg_plan.hex_wps
+        if self.coverage_helper(hex_wps.utm_x[self.hex_cntr - 1], hex_wps.utm_y[self.hex_cntr - 1]):
+            self.task_info("Skipping hex " + str(self.hex_cntr) + " (area already covered)")
+            return  # back to NEXT_HEX (keeping hex_source, since we didn't move)
+
         self.state = State.HEX_NAV
 
     def handle_hex_nav(self):
@@ -1204,20 +1596,19 @@ class StateMachine(Node):
 
         self.task_info("Starting hex " + str(self.hex_cntr) + " navigation")
 
-        hex_lat, hex_lon = meters2LatLon(
-            self.leg.latitude,
-            self.leg.longitude,
-            self.coord[0],
-            self.coord[1],
-        )
-        hex_wp = latLonYaw2Geopose(hex_lat, hex_lon)
-        nav_result = self.navigate_helper(hex_wp, hex_mode=True)
+        hex_wp = self.leg_plan.hex_wps.geopose(self.hex_cntr - 1)
+
+        # Use the precomputed path if we're starting from where it was planned from
+        path = self.leg_plan.hex_path(self.hex_source, self.hex_cntr - 1)
+        nav_result = self.navigate_helper(hex_wp, hex_mode=True, path=path)
 
         if nav_result == Result.SUCCEEDED:
             self.task_info("Navigated to hex " + str(self.hex_cntr))
+            self.hex_source = self.hex_cntr  # paths from this hex point are at index hex_cntr
             self.state = State.NEXT_HEX
         elif nav_result == Result.FAILED:
             self.task_error("Failed to navigate to hex " + str(self.hex_cntr))
+            self.hex_source = None  # we're somewhere in between, plan the next one from scratch
             self.state = State.NEXT_HEX
         elif nav_result == Result.FOUND:
             self.task_info("Found the object/tag")
@@ -1229,11 +1620,9 @@ class StateMachine(Node):
         """
 
         self.task_info("Starting object/tag navigation")
+        self.discard_preplan_helper()  # we didn't get where it was planned from
 
-        found_wp = latLonYaw2Geopose(
-            self.found_poses[self.leg.name].position.latitude,
-            self.found_poses[self.leg.name].position.longitude,
-        )
+        found_wp = self.found_poses[self.leg.name]  # replaced (never modified) by new detections
         nav_result = self.navigate_helper(found_wp, found_mode=True)
 
         if nav_result == Result.SUCCEEDED:
@@ -1243,11 +1632,11 @@ class StateMachine(Node):
             if self.leg.type == "obj":
                 self.task_info("Disabling object detection")
                 self.obj_request.data = False
-                asyncio.run(self.async_service_call(self.obj_client, self.obj_request))
+                self.service_call(self.obj_client, self.obj_request)
             elif self.leg.type == "aruco":
                 self.task_info("Disabling aruco detection")
                 self.aruco_request.transition.id = Transition.TRANSITION_DEACTIVATE
-                asyncio.run(self.async_service_call(self.aruco_client, self.aruco_request))
+                self.service_call(self.aruco_client, self.aruco_request)
 
             self.state = State.SIGNAL_SUCCESS
         elif nav_result == Result.FAILED:
@@ -1257,11 +1646,11 @@ class StateMachine(Node):
             if self.leg.type == "obj":
                 self.task_info("Disabling object detection")
                 self.obj_request.data = False
-                asyncio.run(self.async_service_call(self.obj_client, self.obj_request))
+                self.service_call(self.obj_client, self.obj_request)
             elif self.leg.type == "aruco":
                 self.task_info("Disabling aruco detection")
                 self.aruco_request.transition.id = Transition.TRANSITION_DEACTIVATE
-                asyncio.run(self.async_service_call(self.aruco_client, self.aruco_request))
+                self.service_call(self.aruco_client, self.aruco_request)
 
             self.state = State.NEXT_LEG
         elif nav_result == Result.FOUND:
@@ -1276,12 +1665,12 @@ class StateMachine(Node):
         self.task_info("Flashing LED to indicate arrival")
 
         # Trigger the arrival state
-        asyncio.run(self.async_service_call(self.arrival_client, self.arrival_request))
+        self.service_call(self.arrival_client, self.arrival_request)
 
         time.sleep(self.wait_time)
 
         # Trigger the autonomy state
-        asyncio.run(self.async_service_call(self.auto_client, self.auto_request))
+        self.service_call(self.auto_client, self.auto_request)
 
         self.state = State.NEXT_LEG
 
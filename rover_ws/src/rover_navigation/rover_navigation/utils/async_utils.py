@@ -0,0 +1,139 @@
+import asyncio
+import bisect
+import math
+import time
+from threading import Lock, Thread
+
+LATENCY_BINS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]  # histogram bin edges
+
+
+class LatencyHistogram:
+    """
+    Thread-safe latency histogram (per call name) for the service and action round trips
+    """
+
+    def __init__(self, bins_ms=LATENCY_BINS_MS):
+        self.bins_ms = list(bins_ms)
+        self.counts = {}
+        self.totals = {}
+        self.maxes = {}
+        self.lock = Lock()
+
+    def record(self, name, seconds):
+        """
+        Adds one round trip (in seconds) to the histogram for name
+        """
+
+        ms = seconds * 1000.0
+        with self.lock:
+            if name not in self.counts:
+                self.counts[name] = [0] * (len(self.bins_ms) + 1)
+                self.totals[name] = 0.0
+                self.maxes[name] = 0.0
+            self.counts[name][bisect.bisect_right(self.bins_ms, ms)] += 1  # bins are [previous edge, edge), like their labels
+            self.totals[name] += ms
+            self.maxes[name] = max(self.maxes[name], ms)
+
+    def percentile(self, name, fraction):
+        """
+        Returns the upper bin edge (in ms) below which the given fraction of the round trips fall
+        """
+
+        with self.lock:
+            counts = self.counts.get(name)
+            if not counts:
+                return None
+            target = fraction * sum(counts)
+            seen = 0
+            for i, count in enumerate(counts):
+                seen += count
+                if seen >= target:
+                    return self.bins_ms[i] if i < len(self.bins_ms) else math.inf
+
+    def summary(self):
+        """
+        Returns one line per call name with the count, mean, p50/p90/max and the histogram bins
+        """
+
+        lines = []
+        for name in sorted(self.counts):
+            p50 = self.percentile(name, 0.5)
+            p90 = self.percentile(name, 0.9)
+            with self.lock:
+                counts = list(self.counts[name])
+                mean = self.totals[name] / sum(counts)
+                max_ms = self.maxes[name]
+            labels = [f"<{edge}ms" for edge in self.bins_ms] + [f">={self.bins_ms[-1]}ms"]
+            bins = " ".join(f"{label}:{count}" for label, count in zip(labels, counts) if count)
+            lines.append(
+                f"{name}: n={sum(counts)} mean={mean:.1f}ms p50<={p50}ms p90<={p90}ms max={max_ms:.1f}ms [{bins}]"
+            )
+        return lines
+
+
+class AsyncLoopThread:
+    """
+    One long-lived asyncio event loop running in its own (daemon) thread
+
+    Coroutines are submitted from any thread and run on the loop, instead of creating and tearing
+    down a new event loop with asyncio.run() for every call. Every run() is timed into latency.
+    """
+
+    def __init__(self, name="async_loop"):
+        self.loop = asyncio.new_event_loop()
+        self.latency = LatencyHistogram()
+        self.thread = Thread(target=self._run_loop, name=name, daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """
+        Schedules a coroutine on the loop (thread-safe), returns a concurrent.futures.Future
+        """
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, name=None, timeout=None):
+        """
+        Runs a coroutine on the loop and blocks until it's done, recording its latency under name
+        """
+
+        if name is None:
+            name = coro.__name__
+        start_time = time.perf_counter()
+        try:
+            return self.submit(coro).result(timeout)
+        finally:
+            self.latency.record(name, time.perf_counter() - start_time)
+
+    def stop(self):
+        """
+        Stops the loop and waits for its thread to exit
+        """
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+async def wrap_future(future):
+    """
+    Awaits an rclpy Future from an asyncio coroutine (like asyncio.wrap_future)
+
+    Awaiting an rclpy Future directly makes asyncio reschedule the task on every loop iteration
+    until it's done, which busy-spins a shared loop. This resolves an asyncio future from the
+    rclpy done callback instead, so the loop sleeps until the result arrives.
+    """
+
+    loop = asyncio.get_running_loop()
+    aio_future = loop.create_future()
+
+    def _set_done(_):
+        if not aio_future.done():
+            aio_future.set_result(None)
+
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_set_done, None))
+    await aio_future
+    return future.result()
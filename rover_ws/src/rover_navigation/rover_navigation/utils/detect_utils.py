@@ -0,0 +1,173 @@
+from collections import deque
+import math
+import numpy as np
+from rclpy.time import Time
+
+GATE_SIGMA = 3.0  # detections further than this many standard deviations away count as outliers
+MAX_OUTLIERS = 3  # consecutive outliers before the estimate restarts from the newest detection
+MIN_CONFIDENCE = 0.05  # lowest weight a single detection gets (confidences are 0-1)
+TF_CACHE_SIZE = 16  # recent transforms kept per source frame
+
+
+class TargetEstimator:
+    """
+    Fuses repeated detections of one target (aruco tag or object) into a position estimate in UTM
+
+    A small Kalman filter with a static target model and an isotropic covariance. Each detection
+    is weighted by its confidence (the measurement variance is divided by it), and a little process
+    noise lets the estimate follow slow drift in the GPS/TF chain. Detections outside the gate
+    are ignored, unless enough of them come in a row (then the estimate restarts from the newest).
+    """
+
+    def __init__(self, measurement_sigma, process_sigma=0.0, gate_sigma=GATE_SIGMA, max_outliers=MAX_OUTLIERS):
+        self.measurement_var = measurement_sigma**2
+        self.process_var = process_sigma**2
+        self.gate_sigma = gate_sigma
+        self.max_outliers = max_outliers
+        self.east = None
+        self.north = None
+        self.var = None
+        self.count = 0
+        self.outliers = 0
+
+    def reset(self, east, north, confidence=1.0):
+        """
+        Restarts the estimate from a single detection
+        """
+
+        self.east = east
+        self.north = north
+        self.var = self.measurement_var / max(confidence, MIN_CONFIDENCE)
+        self.count = 1
+        self.outliers = 0
+
+    def update(self, east, north, confidence=1.0):
+        """
+        Fuses one detection (UTM meters, confidence 0-1), returns False if it was gated out
+        """
+
+        if self.east is None:
+            self.reset(east, north, confidence)
+            return True
+
+        meas_var = self.measurement_var / max(confidence, MIN_CONFIDENCE)
+        prior_var = self.var + self.process_var
+
+        # Gate the detection on its distance from the estimate (Mahalanobis, isotropic)
+        dist = math.hypot(east - self.east, north - self.north)
+        if dist > self.gate_sigma * math.sqrt(prior_var + meas_var):
+            self.outliers += 1
+            if self.outliers >= self.max_outliers:
+                self.reset(east, north, confidence)
+                return True
+            return False
+
+        gain = prior_var / (prior_var + meas_var)
+        self.east += gain * (east - self.east)
+        self.north += gain * (north - self.north)
+        self.var = (1.0 - gain) * prior_var
+        self.count += 1
+        self.outliers = 0
+        return True
+
+    @property
+    def position(self):
+        """
+        The fused (east, north) estimate in UTM, or None before the first detection
+        """
+
+        if self.east is None:
+            return None
+        return self.east, self.north
+
+    @property
+    def sigma(self):
+        """
+        Standard deviation of the estimate (in meters)
+        """
+
+        return math.sqrt(self.var) if self.var is not None else math.inf
+
+
+def stamp_to_ns(stamp):
+    """
+    Converts a builtin_interfaces/Time stamp to integer nanoseconds
+    """
+
+    return stamp.sec * 1_000_000_000 + stamp.nanosec
+
+
+def transform_to_matrix(transform):
+    """
+    Converts a geometry_msgs/TransformStamped to a (3x3 rotation, 3 translation) pair of arrays
+    """
+
+    q = transform.transform.rotation
+    t = transform.transform.translation
+    x, y, z, w = q.x, q.y, q.z, q.w
+    rotation = np.array(
+        [
+            [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+            [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+            [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+        ]
+    )
+    return rotation, np.array([t.x, t.y, t.z])
+
+
+def transform_points(transform, points):
+    """
+    Applies a (rotation, translation) pair to an (N, 3) array of points at once
+    """
+
+    rotation, translation = transform
+    return np.asarray(points, dtype=np.float64).reshape(-1, 3) @ rotation.T + translation
+
+
+class TransformCache:
+    """
+    Short-lived cache of recent target_frame <- source frame transforms from a tf2 buffer
+
+    Lookups never wait: a transform cached for the exact stamp is served from the cache (bursts of
+    detections from the same camera frame), otherwise the buffer is asked for the exact stamp (which
+    tf2 interpolates), then for its latest transform if that's within max_age. None if neither is.
+
+    NOTE: The latest transform isn't interpolated to the stamp, so while the rover turns it puts
+    detections at the wrong bearing. Keep max_age well below the TF publish period.
+    """
+
+    def __init__(self, tf_buffer, target_frame, max_age, size=TF_CACHE_SIZE):
+        self.tf_buffer = tf_buffer
+        self.target_frame = target_frame
+        self.max_age_ns = int(max_age * 1e9)
+        self.size = size
+        self.transforms = {}
+
+    def lookup(self, frame_id, stamp):
+        """
+        Returns the (rotation, translation) transform for frame_id at stamp, or None
+        """
+
+        stamp_ns = stamp_to_ns(stamp)
+        cached = self.transforms.setdefault(frame_id, deque(maxlen=self.size))
+
+        # Cached transform for this exact stamp
+        for cached_ns, transform in cached:
+            if cached_ns == stamp_ns:
+                return transform
+
+        # Exact stamp first (without a timeout, so we never block)
+        try:
+            tf = self.tf_buffer.lookup_transform(self.target_frame, frame_id, stamp)
+        except Exception:
+            # Fall back to the latest transform, if it's close enough to the stamp
+            try:
+                tf = self.tf_buffer.lookup_transform(self.target_frame, frame_id, Time())
+            except Exception:
+                return None
+            if abs(stamp_to_ns(tf.header.stamp) - stamp_ns) > self.max_age_ns:
+                return None
+
+        transform = transform_to_matrix(tf)
+        cached.append((stamp_ns, transform))  # keyed by the requested stamp, like it was looked up
+        return transform
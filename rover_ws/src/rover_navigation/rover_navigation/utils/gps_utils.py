@@ -1,8 +1,36 @@
 import math
 from geographic_msgs.msg import GeoPose
-from geometry_msgs.msg import Quaternion
+from geometry_msgs.msg import PoseStamped, Quaternion
+import numpy as np
 import utm
 
+# UTM projection constants (same series and values as the utm library)
+UTM_K0 = 0.9996
+UTM_E = 0.00669438
+UTM_E_P2 = UTM_E / (1 - UTM_E)
+UTM_R = 6378137
+_SQRT_E = math.sqrt(1 - UTM_E)
+_E1 = (1 - _SQRT_E) / (1 + _SQRT_E)
+UTM_M = (
+    1 - UTM_E / 4 - 3 * UTM_E**2 / 64 - 5 * UTM_E**3 / 256,
+    3 * UTM_E / 8 + 3 * UTM_E**2 / 32 + 45 * UTM_E**3 / 1024,
+    15 * UTM_E**2 / 256 + 45 * UTM_E**3 / 1024,
+    35 * UTM_E**3 / 3072,
+)
+UTM_P = (
+    3 / 2 * _E1 - 27 / 32 * _E1**3 + 269 / 512 * _E1**5,
+    21 / 16 * _E1**2 - 55 / 32 * _E1**4,
+    151 / 96 * _E1**3 - 417 / 128 * _E1**5,
+    1097 / 512 * _E1**4,
+)
+
+# WGS84 ellipsoid (for the local tangent plane)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_EP2 = WGS84_E2 / (1 - WGS84_E2)
+
 
 def quaternion_from_euler(roll, pitch, yaw):
     """
@@ -73,8 +101,8 @@ def latLon2Meters(lat1, lon1, lat2, lon2):
     """
 
     # Convert GPS coordinates to UTM
-    utm1 = utm.from_latlon(lat1, lon1)
-    utm2 = utm.from_latlon(lat2, lon2)
+    utm1 = get_utm_zone(lat1, lon1).from_latlon(lat1, lon1)
+    utm2 = get_utm_zone(lat2, lon2).from_latlon(lat2, lon2)
 
     # Calculate the distance between the two points
     distance = ((utm2[0] - utm1[0]) ** 2 + (utm2[1] - utm1[1]) ** 2) ** 0.5
@@ -88,12 +116,390 @@ def meters2LatLon(lat, lon, x_offset, y_offset):
     """
 
     # Convert GPS coordinates to UTM
-    utm1 = utm.from_latlon(lat, lon)
+    zone = get_utm_zone(lat, lon)
+    utm1 = zone.from_latlon(lat, lon)
 
     # Calculate the new UTM coordinates
     utm2 = (utm1[0] + x_offset, utm1[1] + y_offset)
 
     # Convert UTM coordinates back to GPS
-    lat2, lon2 = utm.to_latlon(utm2[0], utm2[1], utm1[2], utm1[3])
+    lat2, lon2 = zone.to_latlon(utm2[0], utm2[1])
 
     return lat2, lon2
+
+
+class UtmZone:
+    """
+    Fast path for utm.from_latlon/utm.to_latlon inside one (cached) UTM zone
+
+    Uses the same series as the utm library, but with the zone's central meridian and hemisphere
+    worked out once, no range checks and plain math (instead of NumPy) for single points, which
+    makes a conversion about 10x faster. The *_array variants convert whole NumPy arrays at once.
+    """
+
+    __slots__ = ("zone_number", "zone_letter", "northern", "central_lon")
+
+    def __init__(self, zone_number, zone_letter):
+        self.zone_number = zone_number
+        self.zone_letter = zone_letter.upper()
+        self.northern = self.zone_letter >= "N"
+        self.central_lon = math.radians((zone_number - 1) * 6 - 180 + 3)
+
+    def from_latlon(self, lat, lon):
+        """
+        Converts a latitude and longitude to a UTM (easting, northing) in this zone
+        """
+
+        lat_rad = math.radians(lat)
+        lat_sin = math.sin(lat_rad)
+        lat_cos = math.cos(lat_rad)
+        lat_tan = lat_sin / lat_cos
+        lat_tan2 = lat_tan * lat_tan
+        lat_tan4 = lat_tan2 * lat_tan2
+
+        n = UTM_R / math.sqrt(1 - UTM_E * lat_sin**2)
+        c = UTM_E_P2 * lat_cos**2
+        a = lat_cos * ((math.radians(lon) - self.central_lon + math.pi) % (2 * math.pi) - math.pi)
+        a2 = a * a
+        a3 = a2 * a
+        a4 = a3 * a
+        a5 = a4 * a
+        a6 = a5 * a
+
+        m = UTM_R * (
+            UTM_M[0] * lat_rad
+            - UTM_M[1] * math.sin(2 * lat_rad)
+            + UTM_M[2] * math.sin(4 * lat_rad)
+            - UTM_M[3] * math.sin(6 * lat_rad)
+        )
+        easting = UTM_K0 * n * (
+            a + a3 / 6 * (1 - lat_tan2 + c) + a5 / 120 * (5 - 18 * lat_tan2 + lat_tan4 + 72 * c - 58 * UTM_E_P2)
+        ) + 500000
+        northing = UTM_K0 * (
+            m
+            + n
+            * lat_tan
+            * (
+                a2 / 2
+                + a4 / 24 * (5 - lat_tan2 + 9 * c + 4 * c**2)
+                + a6 / 720 * (61 - 58 * lat_tan2 + lat_tan4 + 600 * c - 330 * UTM_E_P2)
+            )
+        )
+        if not self.northern:
+            northing += 10000000
+        return easting, northing
+
+    def to_latlon(self, easting, northing):
+        """
+        Converts a UTM (easting, northing) in this zone to a latitude and longitude
+        """
+
+        return self._to_latlon(easting, northing, math)
+
+    def from_latlon_array(self, lats, lons):
+        """
+        Converts NumPy arrays of latitudes and longitudes to arrays of eastings and northings
+        """
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if lats.size == 0:  # the utm library can't bounds check empty arrays
+            return np.empty(lats.shape), np.empty(lons.shape)
+        return utm.from_latlon(lats, lons, self.zone_number, self.zone_letter)[:2]
+
+    def to_latlon_array(self, eastings, northings):
+        """
+        Converts NumPy arrays of eastings and northings to arrays of latitudes and longitudes
+        """
+
+        return self._to_latlon(np.asarray(eastings, dtype=np.float64), np.asarray(northings, dtype=np.float64), np)
+
+    def _to_latlon(self, easting, northing, mathlib):
+        x = easting - 500000
+        y = northing if self.northern else northing - 10000000
+
+        mu = y / UTM_K0 / (UTM_R * UTM_M[0])
+        p_rad = (
+            mu
+            + UTM_P[0] * mathlib.sin(2 * mu)
+            + UTM_P[1] * mathlib.sin(4 * mu)
+            + UTM_P[2] * mathlib.sin(6 * mu)
+            + UTM_P[3] * mathlib.sin(8 * mu)
+        )
+        p_sin = mathlib.sin(p_rad)
+        p_sin2 = p_sin * p_sin
+        p_cos = mathlib.cos(p_rad)
+        p_tan = p_sin / p_cos
+        p_tan2 = p_tan * p_tan
+        p_tan4 = p_tan2 * p_tan2
+
+        ep_sin = 1 - UTM_E * p_sin2
+        n = UTM_R / mathlib.sqrt(ep_sin)
+        r = (1 - UTM_E) / ep_sin
+        c = UTM_E_P2 * p_cos**2
+        c2 = c * c
+        d = x / (n * UTM_K0)
+        d2 = d * d
+        d3 = d2 * d
+        d4 = d3 * d
+        d5 = d4 * d
+        d6 = d5 * d
+
+        latitude = p_rad - (p_tan / r) * (
+            d2 / 2
+            - d4 / 24 * (5 + 3 * p_tan2 + 10 * c - 4 * c2 - 9 * UTM_E_P2)
+            + d6 / 720 * (61 + 90 * p_tan2 + 298 * c + 45 * p_tan4 - 252 * UTM_E_P2 - 3 * c2)
+        )
+        longitude = (
+            d - d3 / 6 * (1 + 2 * p_tan2 + c) + d5 / 120 * (5 - 2 * c + 28 * p_tan2 - 3 * c2 + 8 * UTM_E_P2 + 24 * p_tan4)
+        ) / p_cos
+        longitude = (longitude + self.central_lon + math.pi) % (2 * math.pi) - math.pi
+        return mathlib.degrees(latitude), mathlib.degrees(longitude)
+
+
+_utm_zones = {}
+
+
+def get_utm_zone(lat, lon):
+    """
+    Returns the (cached) UtmZone a latitude and longitude falls in
+    """
+
+    key = (utm.latlon_to_zone_number(lat, lon), utm.latitude_to_zone_letter(lat))
+    zone = _utm_zones.get(key)
+    if zone is None:
+        zone = _utm_zones[key] = UtmZone(*key)
+    return zone
+
+
+class LocalTangentPlane:
+    """
+    Local east-north-up (ENU) tangent plane anchored at a mission origin
+
+    Exact WGS84 conversions through ECEF coordinates (the inverse uses Bowring's closed form, which
+    is accurate to well under a millimeter near the ground), so unlike UTM there are no zone edges
+    or scale factor to worry about. The *_array variants convert whole NumPy arrays at once.
+    """
+
+    __slots__ = ("lat", "lon", "alt", "origin", "rotation")
+
+    def __init__(self, lat, lon, alt=0.0):
+        self.lat, self.lon, self.alt = lat, lon, alt
+        self.origin = np.array(self._to_ecef(math.radians(lat), math.radians(lon), alt, math))
+        lat_sin, lat_cos = math.sin(math.radians(lat)), math.cos(math.radians(lat))
+        lon_sin, lon_cos = math.sin(math.radians(lon)), math.cos(math.radians(lon))
+        self.rotation = np.array(
+            [
+                [-lon_sin, lon_cos, 0.0],
+                [-lat_sin * lon_cos, -lat_sin * lon_sin, lat_cos],
+                [lat_cos * lon_cos, lat_cos * lon_sin, lat_sin],
+            ]
+        )  # ECEF -> ENU
+
+    def to_enu(self, lat, lon, alt=0.0):
+        """
+        Converts a latitude, longitude and altitude to (east, north, up) meters from the origin
+        """
+
+        x, y, z = self._to_ecef(math.radians(lat), math.radians(lon), alt, math)
+        x0, y0, z0 = self.origin.tolist()
+        dx, dy, dz = x - x0, y - y0, z - z0
+        (r00, r01, r02), (r10, r11, r12), (r20, r21, r22) = self.rotation.tolist()
+        return (
+            r00 * dx + r01 * dy + r02 * dz,
+            r10 * dx + r11 * dy + r12 * dz,
+            r20 * dx + r21 * dy + r22 * dz,
+        )
+
+    def from_enu(self, east, north, up=0.0):
+        """
+        Converts (east, north, up) meters from the origin to a latitude, longitude and altitude
+        """
+
+        (r00, r01, r02), (r10, r11, r12), (r20, r21, r22) = self.rotation.tolist()
+        x0, y0, z0 = self.origin.tolist()
+        x = x0 + r00 * east + r10 * north + r20 * up
+        y = y0 + r01 * east + r11 * north + r21 * up
+        z = z0 + r02 * east + r12 * north + r22 * up
+        return self._from_ecef(x, y, z, math)
+
+    def to_enu_array(self, lats, lons, alts=0.0):
+        """
+        Converts NumPy arrays of latitudes, longitudes (and altitudes) to east, north and up arrays
+        """
+
+        ecef = np.stack(
+            np.broadcast_arrays(*self._to_ecef(np.radians(lats), np.radians(lons), np.asarray(alts, dtype=np.float64), np)),
+            axis=-1,
+        )
+        enu = (ecef - self.origin) @ self.rotation.T
+        return enu[..., 0], enu[..., 1], enu[..., 2]
+
+    def from_enu_array(self, easts, norths, ups=0.0):
+        """
+        Converts NumPy arrays of east, north (and up) meters to latitude, longitude and altitude arrays
+        """
+
+        enu = np.stack(np.broadcast_arrays(np.asarray(easts, dtype=np.float64), norths, ups), axis=-1)
+        ecef = enu @ self.rotation + self.origin
+        return self._from_ecef(ecef[..., 0], ecef[..., 1], ecef[..., 2], np)
+
+    @staticmethod
+    def _to_ecef(lat_rad, lon_rad, alt, mathlib):
+        lat_sin, lat_cos = mathlib.sin(lat_rad), mathlib.cos(lat_rad)
+        n = WGS84_A / mathlib.sqrt(1 - WGS84_E2 * lat_sin * lat_sin)
+        return (
+            (n + alt) * lat_cos * mathlib.cos(lon_rad),
+            (n + alt) * lat_cos * mathlib.sin(lon_rad),
+            (n * (1 - WGS84_E2) + alt) * lat_sin,
+        )
+
+    @staticmethod
+    def _from_ecef(x, y, z, mathlib):
+        # Bowring's closed form (one iteration is plenty at ground level)
+        atan2 = np.arctan2 if mathlib is np else math.atan2
+        p = mathlib.sqrt(x * x + y * y)
+        theta = atan2(z * WGS84_A, p * WGS84_B)
+        theta_sin, theta_cos = mathlib.sin(theta), mathlib.cos(theta)
+        lat_rad = atan2(z + WGS84_EP2 * WGS84_B * theta_sin**3, p - WGS84_E2 * WGS84_A * theta_cos**3)
+        lon_rad = atan2(y, x)
+        lat_sin = mathlib.sin(lat_rad)
+        n = WGS84_A / mathlib.sqrt(1 - WGS84_E2 * lat_sin * lat_sin)
+        alt = p / mathlib.cos(lat_rad) - n
+        return mathlib.degrees(lat_rad), mathlib.degrees(lon_rad), alt
+
+
+class MissionFrame:
+    """
+    Shared coordinate frame for one autonomy task, anchored at the first GPS fix
+
+    Converts between latitude/longitude, UTM (in the origin's zone), local east-north meters
+    (a LocalTangentPlane at the origin) and DEM pixels (given a map's affine transform), with the
+    projection constants and inverse map transforms worked out once instead of on every call.
+    """
+
+    __slots__ = ("lat", "lon", "zone", "plane", "inverse_transforms")
+
+    def __init__(self, lat, lon, alt=0.0):
+        self.lat, self.lon = lat, lon
+        self.zone = get_utm_zone(lat, lon)
+        self.plane = LocalTangentPlane(lat, lon, alt)
+        self.inverse_transforms = {}  # map transform -> its inverse (UTM -> pixel)
+
+    @classmethod
+    def from_geopose(cls, geopose):
+        return cls(geopose.position.latitude, geopose.position.longitude)
+
+    @property
+    def utm_zone(self):
+        return self.zone.zone_number, self.zone.zone_letter
+
+    def latlon_to_utm(self, lat, lon):
+        return self.zone.from_latlon(lat, lon)
+
+    def utm_to_latlon(self, easting, northing):
+        return self.zone.to_latlon(easting, northing)
+
+    def latlon_to_local(self, lat, lon):
+        return self.plane.to_enu(lat, lon)[:2]
+
+    def local_to_latlon(self, east, north):
+        return self.plane.from_enu(east, north)[:2]
+
+    def distance(self, lat1, lon1, lat2, lon2):
+        """
+        Distance in meters between two GPS coordinates (in UTM, like latLon2Meters)
+        """
+
+        east1, north1 = self.zone.from_latlon(lat1, lon1)
+        east2, north2 = self.zone.from_latlon(lat2, lon2)
+        return math.hypot(east2 - east1, north2 - north1)
+
+    def offset_latlon(self, lat, lon, x_offset, y_offset):
+        """
+        Moves GPS coordinates by an (x, y) offset in meters (in UTM, like meters2LatLon)
+        """
+
+        east, north = self.zone.from_latlon(lat, lon)
+        return self.zone.to_latlon(east + x_offset, north + y_offset)
+
+    def latlon_to_pixel(self, lat, lon, transform):
+        """
+        Converts GPS coordinates to the (row, col) DEM pixel of a map with the given transform
+        """
+
+        inverse = self.inverse_transforms.get(transform)
+        if inverse is None:
+            inverse = self.inverse_transforms[transform] = ~transform
+        east, north = self.zone.from_latlon(lat, lon)
+        col, row = inverse * (east, north)
+        return int(math.floor(row)), int(math.floor(col))
+
+    def pixels_to_latlon(self, pixels, transform):
+        """
+        Converts an (N, 2) array of (row, col) DEM pixels to arrays of latitudes and longitudes
+        """
+
+        rows, cols = pixels[:, 0] + 0.5, pixels[:, 1] + 0.5  # Use pixel centers
+        east = transform.a * cols + transform.b * rows + transform.c
+        north = transform.d * cols + transform.e * rows + transform.f
+        return self.zone.to_latlon_array(east, north)
+
+
+class WaypointPath:
+    """
+    GPS waypoint path stored as NumPy arrays (lat, lon, yaw, utm_x, utm_y) instead of messages
+
+    The planners build these from whole arrays at once, and ROS messages are only created when
+    they're needed at the Nav2 (to_poses) or mapviz/GeoPose (geopose, iterating) boundary.
+    """
+
+    __slots__ = ("lat", "lon", "yaw", "utm_x", "utm_y")
+
+    def __init__(self, lat, lon, yaw, utm_x, utm_y):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.yaw = np.asarray(yaw, dtype=np.float64)
+        self.utm_x = np.asarray(utm_x, dtype=np.float64)
+        self.utm_y = np.asarray(utm_y, dtype=np.float64)
+
+    @classmethod
+    def from_latlon(cls, lats, lons, frame, yaws=0.0):
+        """
+        Builds a path from latitude and longitude arrays, converting them to UTM in the frame
+        """
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        utm_x, utm_y = frame.zone.from_latlon_array(lats, lons)
+        return cls(lats, lons, np.broadcast_to(yaws, lats.shape), utm_x, utm_y)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __iter__(self):
+        for i in range(len(self.lat)):
+            yield self.geopose(i)
+
+    def geopose(self, i):
+        """
+        Returns waypoint i as a geographic_msgs/GeoPose
+        """
+
+        return latLonYaw2Geopose(float(self.lat[i]), float(self.lon[i]), float(self.yaw[i]))
+
+    def to_poses(self, stamp):
+        """
+        Returns the waypoints as geometry_msgs/PoseStamped in the "utm" frame (for Nav2)
+        """
+
+        poses = []
+        for x, y, yaw in zip(self.utm_x.tolist(), self.utm_y.tolist(), self.yaw.tolist()):
+            pose = PoseStamped()
+            pose.header.frame_id = "utm"
+            pose.header.stamp = stamp
+            pose.pose.position.x = x
+            pose.pose.position.y = y
+            pose.pose.orientation = quaternion_from_euler(0.0, 0.0, yaw)
+            poses.append(pose)
+        return poses
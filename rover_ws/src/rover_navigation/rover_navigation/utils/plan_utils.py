@@ -1,13 +1,19 @@
 import math
+import numpy as np
+import time
 from itertools import permutations
 from rover_navigation.utils.gps_utils import (
     latLonYaw2Geopose,
-    quaternion_from_euler,
-    latLon2Meters,
+    MissionFrame,
+    WaypointPath,
 )
 
+MAX_HELD_KARP_LEGS = 15  # "auto" order planning uses the heuristic planner above this many legs
+HEURISTIC_TIME_BUDGET = 1.0  # seconds the heuristic order planner may spend improving its order
+SPIN_STOP_COST = 2.0  # meters of driving that take about as long as one spin search stop
 
-def basicPathPlanner(geopose1, geopose2, wp_dist):
+
+def basicPathPlanner(geopose1, geopose2, wp_dist, frame=None):
     """
     Generate intermediary waypoints in a straight line between two GPS coordinates
 
@@ -15,7 +21,9 @@ def basicPathPlanner(geopose1, geopose2, wp_dist):
     :date: Mar 2025
     """
 
-    new_wps = []
+    new_lats, new_lons = [], []
+    if frame is None:
+        frame = MissionFrame.from_geopose(geopose1)
 
     # Get starting waypoint GPS coordinates
     start_lat = geopose1.position.latitude
@@ -23,13 +31,14 @@ def basicPathPlanner(geopose1, geopose2, wp_dist):
     end_lat = geopose2.position.latitude
     end_lon = geopose2.position.longitude
 
-    # Calculate the desire yaw angle for movement
-    yaw = math.atan((end_lat - start_lat) / (end_lon - start_lon))
-    if end_lon < start_lon:
-        yaw += math.pi
+    # Calculate the desire yaw angle for movement (from the east-north offset, so it's still
+    # defined when both points share a latitude or longitude)
+    start_east, start_north = frame.latlon_to_local(start_lat, start_lon)
+    end_east, end_north = frame.latlon_to_local(end_lat, end_lon)
+    yaw = math.atan2(end_north - start_north, end_east - start_east)
 
     # Calculate the distance between the two points in lat/lon degrees
-    distance = latLon2Meters(start_lat, start_lon, end_lat, end_lon)
+    distance = frame.distance(start_lat, start_lon, end_lat, end_lon)
 
     # Calculate the number of intermediary waypoints
     num_waypoints = int(math.ceil(distance / wp_dist))
@@ -42,21 +51,17 @@ def basicPathPlanner(geopose1, geopose2, wp_dist):
 
         # Generate intermediary waypoints
         for i in range(1, num_waypoints):
-            lat = start_lat + i * step_lat
-            lon = start_lon + i * step_lon
-
-            geopose = latLonYaw2Geopose(lat, lon, yaw)
-
-            new_wps.append(geopose)
+            new_lats.append(start_lat + i * step_lat)
+            new_lons.append(start_lon + i * step_lon)
 
     # Add the original waypoint
-    geopose2.orientation = quaternion_from_euler(0.0, 0.0, yaw)
-    new_wps.append(geopose2)
+    new_lats.append(end_lat)
+    new_lons.append(end_lon)
 
-    return new_wps
+    return WaypointPath.from_latlon(new_lats, new_lons, frame, yaw)
 
 
-def basicOrderPlanner(legs, fix):
+def basicOrderPlanner(legs, fix, cost_matrix=None):
     """
     Brute force the optimal order to complete the task legs (based on distance)
 
@@ -70,38 +75,282 @@ def basicOrderPlanner(legs, fix):
     :date: Mar 2025
     """
 
+    if cost_matrix is None:
+        cost_matrix = leg_cost_matrix(legs, fix)
+
     lowest_cost = float("inf")
     best_order = []
 
     # Generate all possible permutations of the task legs
-    for order in permutations(legs):
+    for order in permutations(range(len(legs))):
 
         # Calculate the cost of the current order
-        fix_geopose = latLonYaw2Geopose(fix.position.latitude, fix.position.longitude)
-        leg_geopose = latLonYaw2Geopose(order[0].latitude, order[0].longitude)
-        cost = latLon2Meters(
-            fix_geopose.position.latitude,
-            fix_geopose.position.longitude,
-            leg_geopose.position.latitude,
-            leg_geopose.position.longitude,
-        )
-
-        for i in range(len(order) - 1):
-
-            leg1_geopose = latLonYaw2Geopose(order[i].latitude, order[i].longitude)
-            leg2_geopose = latLonYaw2Geopose(
-                order[i + 1].latitude, order[i + 1].longitude
-            )
-            cost += latLon2Meters(
-                leg1_geopose.position.latitude,
-                leg1_geopose.position.longitude,
-                leg2_geopose.position.latitude,
-                leg2_geopose.position.longitude,
-            )
+        cost = order_cost(order, cost_matrix)
 
         # Update the best order
         if cost < lowest_cost:
             lowest_cost = cost
             best_order = order
 
-    return best_order
+    return [legs[i] for i in best_order]
+
+
+def heldKarpOrderPlanner(legs, fix, cost_matrix=None):
+    """
+    Find the optimal order to complete the task legs with Held-Karp dynamic programming
+
+    Same result as basicOrderPlanner, but in O(2^n n^2) instead of O(n! n) time, so it stays fast
+    up to ~15 legs. The DP table holds the cheapest cost of visiting each subset of legs (as a
+    bitmask) and ending at each leg in it, and each subset is filled in with one NumPy operation.
+    """
+
+    num_legs = len(legs)
+    if num_legs <= 1:
+        return list(legs)
+    if cost_matrix is None:
+        cost_matrix = leg_cost_matrix(legs, fix)
+    cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+    step = cost_matrix[1:, 1:]  # step[i, j] is the cost from leg i to leg j
+
+    num_masks = 1 << num_legs
+    bits = 1 << np.arange(num_legs)
+    cost = np.full((num_masks, num_legs), np.inf)
+    parent = np.full((num_masks, num_legs), -1, dtype=np.int64)
+    cost[bits, np.arange(num_legs)] = cost_matrix[0, 1:]
+
+    for mask in range(1, num_masks):
+        if mask & (mask - 1) == 0:
+            continue  # single leg subsets come straight from the fix
+
+        # Cheapest way to end at each leg j in the subset, coming from the subset without j
+        ends = np.flatnonzero(mask & bits)
+        candidates = cost[mask ^ bits[ends]] + step[:, ends].T
+        best = candidates.argmin(axis=1)
+        cost[mask, ends] = candidates[np.arange(len(ends)), best]
+        parent[mask, ends] = best
+
+    # Walk the parents back from the cheapest last leg
+    mask = num_masks - 1
+    leg = int(cost[mask].argmin())
+    order = []
+    while leg != -1:
+        order.append(leg)
+        mask, leg = mask ^ (1 << leg), int(parent[mask, leg])
+    order.reverse()
+    return [legs[i] for i in order]
+
+
+def heuristicOrderPlanner(legs, fix, cost_matrix=None, time_budget=HEURISTIC_TIME_BUDGET):
+    """
+    Find a good order to complete the task legs when there are too many to plan optimally
+
+    Starts from the nearest neighbor order and improves it with 2-opt (reversing a run of legs)
+    and Or-opt (moving a run of 1-3 legs somewhere else) moves until none of them help or the
+    time budget (in seconds) runs out.
+
+    NOTE: This is only a local search, so the order can be well off the optimum (a random 7 leg
+    asymmetric cost matrix came out over 10% worse than Held-Karp). Use it past MAX_HELD_KARP_LEGS.
+    """
+
+    num_legs = len(legs)
+    if num_legs <= 1:
+        return list(legs)
+    if cost_matrix is None:
+        cost_matrix = leg_cost_matrix(legs, fix)
+    cost_matrix = np.asarray(cost_matrix, dtype=np.float64)
+    deadline = time.monotonic() + time_budget
+
+    # Nearest neighbor order from the fix
+    order = []
+    unvisited = set(range(num_legs))
+    current = 0
+    while unvisited:
+        leg = min(unvisited, key=lambda i: cost_matrix[current, i + 1])
+        order.append(leg)
+        unvisited.remove(leg)
+        current = leg + 1
+    best_cost = order_cost(order, cost_matrix)
+
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+
+        # 2-opt
+        for i in range(num_legs - 1):
+            for k in range(i + 1, num_legs):
+                candidate = order[:i] + order[i:k + 1][::-1] + order[k + 1:]
+                candidate_cost = order_cost(candidate, cost_matrix)
+                if candidate_cost < best_cost - 1e-9:
+                    order, best_cost, improved = candidate, candidate_cost, True
+            if time.monotonic() >= deadline:
+                break
+
+        # Or-opt
+        for length in range(1, min(3, num_legs - 1) + 1):
+            for i in range(num_legs - length + 1):
+                segment = order[i:i + length]
+                rest = order[:i] + order[i + length:]
+                for j in range(len(rest) + 1):
+                    if j == i:
+                        continue  # same order
+                    candidate = rest[:j] + segment + rest[j:]
+                    candidate_cost = order_cost(candidate, cost_matrix)
+                    if candidate_cost < best_cost - 1e-9:
+                        order, best_cost, improved = candidate, candidate_cost, True
+                        break
+                if time.monotonic() >= deadline:
+                    break
+            if time.monotonic() >= deadline:
+                break
+
+    return [legs[i] for i in order]
+
+
+def orderPlanner(legs, fix, planner="auto", cost_matrix=None, frame=None):
+    """
+    Order the task legs with the selected order planner
+
+    "brute_force" (basicOrderPlanner), "held_karp" (heldKarpOrderPlanner), "heuristic"
+    (heuristicOrderPlanner) or "auto" (Held-Karp up to MAX_HELD_KARP_LEGS legs, heuristic above).
+    """
+
+    if cost_matrix is None:
+        cost_matrix = leg_cost_matrix(legs, fix, frame)
+
+    if planner == "auto":
+        planner = "held_karp" if len(legs) <= MAX_HELD_KARP_LEGS else "heuristic"
+    if planner == "brute_force":
+        return basicOrderPlanner(legs, fix, cost_matrix)
+    elif planner == "held_karp":
+        return heldKarpOrderPlanner(legs, fix, cost_matrix)
+    elif planner == "heuristic":
+        return heuristicOrderPlanner(legs, fix, cost_matrix)
+    raise Exception("Invalid order planner: " + str(planner))
+
+
+def leg_cost_matrix(legs, fix, frame=None):
+    """
+    Straight line (UTM) distances between the GPS fix (index 0) and every task leg (index i + 1)
+    """
+
+    points = leg_points(legs, fix, frame)
+    return np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+
+
+def leg_points(legs, fix, frame=None):
+    """
+    UTM coordinates of the GPS fix (index 0) and every task leg (index i + 1), as an (N, 2) array
+    """
+
+    if frame is None:
+        frame = MissionFrame.from_geopose(fix)
+    lats = [fix.position.latitude] + [leg.latitude for leg in legs]
+    lons = [fix.position.longitude] + [leg.longitude for leg in legs]
+    return np.stack(frame.zone.from_latlon_array(lats, lons), axis=-1)
+
+
+def search_model(hex_coord, spin_stops, spin_stop_cost=SPIN_STOP_COST):
+    """
+    Expected cost (in meters of driving) and exit positions of the spin and hex search of a leg
+
+    Assumes the object/tag is equally likely to be found during the spin search at the leg or at any
+    of the hex points, so the search ends (and the rover leaves from) each of those stops with
+    the same probability. Returns (expected_cost, stops, prob) with the stops as (x, y) offsets in
+    meters from the leg.
+    """
+
+    stops = [(0.0, 0.0)] + [tuple(coord) for coord in hex_coord]
+    prob = 1.0 / len(stops)
+    spin_cost = (spin_stops - 1) * spin_stop_cost  # we don't spin back to where we started
+
+    expected_cost = 0.0
+    driven = 0.0
+    for k in range(len(stops)):
+        if k > 0:
+            driven += math.dist(stops[k - 1], stops[k])
+        expected_cost += prob * (spin_cost + driven)
+    return expected_cost, stops, prob
+
+
+def search_cost_matrix(legs, fix, search_patterns, spin_stops, spin_stop_cost=SPIN_STOP_COST, frame=None):
+    """
+    Extra cost of the searches to add to a leg_cost_matrix (or terrainCostMatrix)
+
+    search_patterns maps a leg type to its hex search pattern (legs of other types aren't searched).
+    Going to leg j costs its expected search cost on top, and leaving a searched leg i starts from
+    its expected exit position instead of the leg itself (the straight line difference is added).
+    """
+
+    num_points = len(legs) + 1
+    points = leg_points(legs, fix, frame)
+    direct = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+
+    extra = np.zeros((num_points, num_points))
+    for i, leg in enumerate(legs, start=1):
+        if leg.type not in search_patterns:
+            continue
+        expected_cost, stops, prob = search_model(search_patterns[leg.type], spin_stops, spin_stop_cost)
+        extra[:, i] += expected_cost
+
+        # Expected distance from wherever the search ends to every other point
+        exits = points[i] + np.asarray(stops)
+        exit_dist = np.sqrt(((exits[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+        extra[i, :] += prob * exit_dist.sum(axis=0) - direct[i]
+
+    np.fill_diagonal(extra, 0.0)
+    return extra
+
+
+def order_cost(order, cost_matrix):
+    """
+    Total cost of driving from the fix through the legs in order (indices into the legs)
+    """
+
+    cost = cost_matrix[0][order[0] + 1]
+    for i in range(len(order) - 1):
+        cost += cost_matrix[order[i] + 1][order[i + 1] + 1]
+    return cost
+
+
+class LegPlan:
+    """
+    Precomputed geometry for one task leg, built once at the start of the task
+
+    Holds the leg waypoint (GPS and UTM), its hex search points (a WaypointPath, empty for legs
+    that aren't searched) and the paths between them, so the state machine doesn't compute any
+    geometry between transitions and the whole search can be inspected up front.
+    """
+
+    __slots__ = ("name", "type", "leg_wp", "utm_x", "utm_y", "hex_wps", "hex_paths")
+
+    def __init__(self, leg, frame, hex_coord=(), wp_dist=None):
+        self.name = leg.name
+        self.type = leg.type
+        self.leg_wp = latLonYaw2Geopose(leg.latitude, leg.longitude)
+        self.utm_x, self.utm_y = frame.latlon_to_utm(leg.latitude, leg.longitude)
+
+        # Hex search points, offset (in meters) from the leg waypoint
+        hex_lats, hex_lons = [], []
+        for coord in hex_coord:
+            hex_lat, hex_lon = frame.offset_latlon(leg.latitude, leg.longitude, coord[0], coord[1])
+            hex_lats.append(hex_lat)
+            hex_lons.append(hex_lon)
+        self.hex_wps = WaypointPath.from_latlon(hex_lats, hex_lons, frame)
+
+        # hex_paths[i][j] is the path to hex point j from the leg waypoint (i = 0) or from hex
+        # point i - 1 (i > 0), same as terrainHexPlanner. Straight paths only from the previous point.
+        num_hex = len(hex_lats)
+        self.hex_paths = [[None] * num_hex for _ in range(num_hex + 1)]
+        if wp_dist is not None:
+            for j in range(num_hex):
+                source = self.leg_wp if j == 0 else self.hex_wps.geopose(j - 1)
+                self.hex_paths[j][j] = basicPathPlanner(source, self.hex_wps.geopose(j), wp_dist, frame)
+
+    def hex_path(self, source, j):
+        """
+        Returns the planned path to hex point j from source (see hex_paths), or None
+        """
+
+        if source is None:
+            return None
+        return self.hex_paths[source][j]
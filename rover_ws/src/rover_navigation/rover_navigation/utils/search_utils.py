@@ -0,0 +1,189 @@
+import math
+import numpy as np
+
+SEARCH_CELL_SIZE = 0.5  # size of the coverage cells the search planner counts (in meters)
+HEX_SPACING_RATIO = 1.8  # hex lattice spacing as a multiple of the detection range (9m for 5m)
+MIN_NEW_COVERAGE = 0.15  # least new area a search point must see (as a fraction of a full view)
+PRIOR_SIGMA_RATIO = 0.5  # spread of where we expect the target (as a multiple of the search radius)
+TURN_COST = 1.0  # meters of driving a 1 radian turn is worth when choosing the next point
+
+
+def coverage_cells(search_radius, cell_size=SEARCH_CELL_SIZE):
+    """
+    Returns the (N, 2) centers of the coverage cells inside the search circle (in meters)
+    """
+
+    steps = np.arange(-search_radius + cell_size / 2, search_radius, cell_size)
+    xs, ys = np.meshgrid(steps, steps)
+    cells = np.column_stack((xs.ravel(), ys.ravel()))
+    return cells[np.hypot(cells[:, 0], cells[:, 1]) <= search_radius]
+
+
+def hex_lattice(search_radius, spacing, heading=0.0):
+    """
+    Returns the (N, 2) hex lattice points within the search circle, rotated to the heading (none
+    if the spacing is wider than the circle)
+    """
+
+    rings = int(math.ceil(search_radius / spacing)) + 1
+    points = []
+    for i in range(-rings, rings + 1):
+        for j in range(-rings, rings + 1):
+            x = spacing * (i + j / 2.0)
+            y = spacing * j * math.sqrt(3) / 2.0
+            if 0.0 < math.hypot(x, y) <= search_radius:
+                points.append((x, y))
+    points = np.asarray(points).reshape(-1, 2)
+    cos_h, sin_h = math.cos(heading), math.sin(heading)
+    return np.column_stack(
+        (cos_h * points[:, 0] - sin_h * points[:, 1], sin_h * points[:, 0] + cos_h * points[:, 1])
+    )
+
+
+def covered_mask(cells, covered):
+    """
+    Returns which cells are already inside one of the covered (x, y, radius) circles
+    """
+
+    mask = np.zeros(len(cells), dtype=bool)
+    for x, y, radius in covered:
+        mask |= np.hypot(cells[:, 0] - x, cells[:, 1] - y) <= radius
+    return mask
+
+
+def searchPatternPlanner(
+    search_radius,
+    detect_range,
+    heading=0.0,
+    covered=None,
+    cell_size=SEARCH_CELL_SIZE,
+    spacing=None,
+    min_new_coverage=MIN_NEW_COVERAGE,
+    prior_sigma=None,
+):
+    """
+    Generate a search pattern (list of (x, y) meter offsets, like the hex_coord tables)
+
+    Candidate points lie on a hex lattice aligned with the rover's heading (radians, counter-clockwise
+    from east). Starting at the center, it greedily goes to the point that sees the most uncovered
+    target probability per meter of driving (and turning), where the target is expected around the
+    center (Gaussian, prior_sigma). Area in covered, a list of (x, y, radius) circles already seen
+    (the spin search at the center, by default), counts as seen. It stops once every point left
+    would see less than min_new_coverage of new area (of a full view, or of the area the covered
+    circles leave if that's smaller).
+    """
+
+    if spacing is None:
+        spacing = HEX_SPACING_RATIO * detect_range
+    if covered is None:
+        covered = [(0.0, 0.0, detect_range)]
+    if prior_sigma is None:
+        prior_sigma = PRIOR_SIGMA_RATIO * search_radius
+
+    cells = coverage_cells(search_radius, cell_size)
+    prior = np.exp(-0.5 * (cells[:, 0] ** 2 + cells[:, 1] ** 2) / prior_sigma**2)
+    seen = covered_mask(cells, covered)
+    candidates = hex_lattice(search_radius, spacing, heading)
+    if not len(candidates):
+        # The detection range is too long for a lattice point to fit in the circle, so try a finer
+        # one (points that wouldn't see anything new past the spin are dropped below)
+        candidates = hex_lattice(search_radius, search_radius / 3.0, heading)
+    views = [np.hypot(cells[:, 0] - x, cells[:, 1] - y) <= detect_range for x, y in candidates]
+    view_cells = math.pi * (detect_range / cell_size) ** 2
+    min_new_cells = max(1.0, min_new_coverage * min(view_cells, np.count_nonzero(~seen)))  # a thin ring left still counts
+
+    pattern = []
+    position = np.zeros(2)
+    remaining = list(range(len(candidates)))
+    while remaining:
+        best = None
+        for k in remaining:
+            new_cells = views[k] & ~seen
+            if np.count_nonzero(new_cells) < min_new_cells:
+                continue
+            offset = candidates[k] - position
+            turn = abs(math.remainder(math.atan2(offset[1], offset[0]) - heading, 2 * math.pi))
+            cost = math.hypot(offset[0], offset[1]) + TURN_COST * turn
+            score = prior[new_cells].sum() / cost
+            if best is None or score > best[0]:
+                best = (score, k)
+        if best is None:
+            break  # every point left would only see area we've already covered
+
+        k = best[1]
+        offset = candidates[k] - position
+        heading = math.atan2(offset[1], offset[0])
+        position = candidates[k]
+        seen |= views[k]
+        remaining.remove(k)
+        pattern.append((round(float(position[0]), 2) + 0.0, round(float(position[1]), 2) + 0.0))
+
+    return pattern
+
+
+def search_coverage(pattern, search_radius, detect_range, covered=None, cell_size=SEARCH_CELL_SIZE):
+    """
+    Fraction of the search circle a pattern sees (including the covered circles)
+    """
+
+    if covered is None:
+        covered = [(0.0, 0.0, detect_range)]
+    cells = coverage_cells(search_radius, cell_size)
+    seen = covered_mask(cells, covered)
+    for x, y in pattern:
+        seen |= np.hypot(cells[:, 0] - x, cells[:, 1] - y) <= detect_range
+    return np.count_nonzero(seen) / len(cells)
+
+
+class CoverageGrid:
+    """
+    Grid of the ground the camera has already seen around a search location (in UTM meters)
+
+    Cells are marked seen when they're within the camera range and field of view of a rover pose.
+    The state machine uses it to skip search points whose surroundings were already swept.
+    """
+
+    def __init__(self, center_x, center_y, radius, cell_size=SEARCH_CELL_SIZE):
+        self.cell_size = cell_size
+        self.size = int(math.ceil(2 * radius / cell_size))
+        self.origin_x = center_x - self.size * cell_size / 2
+        self.origin_y = center_y - self.size * cell_size / 2
+        self.seen = np.zeros((self.size, self.size), dtype=bool)
+
+    def _window(self, x, y, radius):
+        """
+        Returns the row/col slices and cell center (x, y) grids of the cells within radius of x, y
+        """
+
+        col0 = max(int((x - radius - self.origin_x) / self.cell_size), 0)
+        col1 = min(int((x + radius - self.origin_x) / self.cell_size) + 1, self.size)
+        row0 = max(int((y - radius - self.origin_y) / self.cell_size), 0)
+        row1 = min(int((y + radius - self.origin_y) / self.cell_size) + 1, self.size)
+        cols = self.origin_x + (np.arange(col0, col1) + 0.5) * self.cell_size
+        rows = self.origin_y + (np.arange(row0, row1) + 0.5) * self.cell_size
+        cell_x, cell_y = np.meshgrid(cols - x, rows - y)
+        return (slice(row0, row1), slice(col0, col1)), cell_x, cell_y
+
+    def add_view(self, x, y, yaw, fov, view_range):
+        """
+        Marks the cells seen from a rover pose (yaw counter-clockwise from east, fov in radians)
+        """
+
+        window, cell_x, cell_y = self._window(x, y, view_range)
+        if cell_x.size == 0:
+            return
+        in_range = np.hypot(cell_x, cell_y) <= view_range
+        bearing = np.arctan2(cell_y, cell_x) - yaw
+        in_fov = np.abs(np.arctan2(np.sin(bearing), np.cos(bearing))) <= fov / 2
+        self.seen[window] |= in_range & in_fov
+
+    def coverage(self, x, y, radius):
+        """
+        Fraction of the (grid) cells within radius of x, y that have been seen
+        """
+
+        window, cell_x, cell_y = self._window(x, y, radius)
+        inside = np.hypot(cell_x, cell_y) <= radius
+        if not inside.any():
+            return 0.0
+        return np.count_nonzero(self.seen[window][inside]) / np.count_nonzero(inside)
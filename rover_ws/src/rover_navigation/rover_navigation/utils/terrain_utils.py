@@ -1,12 +1,56 @@
+from array import array
 from astar import AStar
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from geographic_msgs.msg import GeoPose, GeoPoint
+import hashlib
+import heapq
 from itertools import permutations
+import json
 import math
+import multiprocessing
+import numpy as np
 import os
 import rasterio
 from rasterio.transform import rowcol
-from rover_navigation.utils.gps_utils import latLonYaw2Geopose, latLon2Meters
-import utm
+from rasterio.windows import Window
+from rover_navigation.utils.gps_utils import (
+    latLonYaw2Geopose,
+    latLon2Meters,
+    geopose2LatLonYaw,
+    MissionFrame,
+    WaypointPath,
+)
+import struct
+from threading import Lock
+import time
+import zipfile
+
+# NOTE: You can add a new GeoTIFF map by adding a file from this link to the maps folder:
+# https://portal.opentopography.org/raster?opentopoID=OTNED.012021.4269.3
+GEOTIFF_PATH = "/home/marsrover-docker/rover_ws/src/rover_navigation/rover_navigation/maps"
+MAP_INDEX_FILE = ".map_index.json"  # footprint index sidecar, kept in the maps folder
+MAP_INDEX_CELL_SIZE = 1000.0  # size of the footprint index grid cells (in meters)
+MAP_INDEX_REFRESH_PERIOD = 5.0  # least time between re-indexing the maps folder on a miss (in seconds)
+MAP_CACHE_SIZE_MB = 256  # default TerrainMapCache limit (fits one precomputed 1.8 Mpx map and its elevation)
+MAP_CACHE_MEMORY_FRACTION = 0.25  # most of the available memory a TerrainMapCache may use
+PYRAMID_FACTOR = 8  # pixels per coarse cell (along each axis) for pyramid planning
+PYRAMID_CORRIDOR = 2  # coarse cells on each side of the coarse path refined at full resolution
+COST_POOL_WORKERS = 4  # most worker processes for the leg ordering cost sweeps (one core is left for the node)
+MIN_REPAIR_BUDGET = 1000  # pixels an incremental replan may always expand before starting over
+
+# The 8 A* movement directions (row, col), in the order neighbors are expanded
+DIRECTIONS = [
+    (0, 1),
+    (0, -1),
+    (1, 0),
+    (-1, 0),
+    (1, 1),
+    (1, -1),
+    (-1, 1),
+    (-1, -1),
+]
+DIRECTION_INDEX = {direction: k for k, direction in enumerate(DIRECTIONS)}
 
 
 class TerrainGraph(AStar):
@@ -14,11 +58,18 @@ class TerrainGraph(AStar):
     A* graph for terrain navigation using GeoTIFF elevation data.
     https://github.com/jrialland/python-astar
 
+    With precompute=True, the edge costs for every pixel and direction are built once as a NumPy
+    grid (see compute_edge_costs), and find_path() searches it with grid_astar() (a grid-specialized
+    search with no per-pixel node objects) instead of python-astar. Looking the costs up from
+    python-astar doesn't pay for building the grid, its open set bookkeeping is most of the time.
+    A grid that was already computed (like a cost sidecar) can be passed in as edge_costs.
+    pyramid_astar() plans coarse-to-fine.
+
     :author: Nelson Durrant
     :date: Apr 2025
     """
 
-    def __init__(self, elevation_data, transform, elev_cost, elev_limit, roll_cost, roll_limit):
+    def __init__(self, elevation_data, transform, elev_cost, elev_limit, roll_cost, roll_limit, precompute=False, edge_costs=None):
         self.elevation_data = elevation_data
         self.transform = transform
         self.rows, self.cols = elevation_data.shape
@@ -27,6 +78,25 @@ class TerrainGraph(AStar):
         self.roll_cost = roll_cost
         self.roll_limit = roll_limit
 
+        self.edge_costs = edge_costs  # already computed (e.g. a memory-mapped cost sidecar)
+        self.coarse_costs = {}  # factor -> coarse_edge_costs
+        if precompute and edge_costs is None:
+            self.edge_costs = compute_edge_costs(elevation_data, elev_cost, elev_limit, roll_cost, roll_limit)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the edge cost grids (the elevation data is shared with the map cache)
+
+        Counted when asked, since grid_astar and pyramid_astar build them lazily. Memory-mapped
+        sidecar costs live in the OS page cache instead of our memory, so they don't count.
+        """
+
+        nbytes = sum(costs.nbytes for costs in self.coarse_costs.values())
+        if self.edge_costs is not None and not isinstance(self.edge_costs, np.memmap):
+            nbytes += self.edge_costs.nbytes
+        return nbytes
+
     def heuristic_cost_estimate(self, n1, n2):
         # Simple Euclidean distance in pixel space
         return ((n1[0] - n2[0]) ** 2 + (n1[1] - n2[1]) ** 2) ** 0.5
@@ -34,22 +104,121 @@ class TerrainGraph(AStar):
     def neighbors(self, node):
         row, col = node
         neighbors_list = []
+
         # Get all viable neighbors (8 directions)
-        for dr, dc in [
-            (0, 1),
-            (0, -1),
-            (1, 0),
-            (-1, 0),
-            (1, 1),
-            (1, -1),
-            (-1, 1),
-            (-1, -1),
-        ]:
+        for dr, dc in DIRECTIONS:
             new_row, new_col = row + dr, col + dc
             if 0 <= new_row < self.rows and 0 <= new_col < self.cols:
                 neighbors_list.append((new_row, new_col))
         return neighbors_list
 
+    def grid_astar(self, start, goal):
+        """
+        Drop-in replacement for astar() using the flat-array grid_astar search
+        """
+
+        if self.edge_costs is None:
+            self.edge_costs = compute_edge_costs(
+                self.elevation_data, self.elev_cost, self.elev_limit, self.roll_cost, self.roll_limit
+            )
+        return grid_astar(self.edge_costs, start, goal)
+
+    def pyramid_astar(self, start, goal, factor=PYRAMID_FACTOR, corridor=PYRAMID_CORRIDOR):
+        """
+        Coarse-to-fine A*: plans over a downsampled elevation map first, then refines the path at
+        full resolution inside a corridor (of +/- corridor coarse cells) around the coarse path.
+
+        Falls back to a full resolution grid_astar if either step fails to find a path.
+        """
+
+        coarse_rows, coarse_cols = self.rows // factor, self.cols // factor
+        if coarse_rows < 2 or coarse_cols < 2:
+            return self.grid_astar(start, goal)
+
+        # 1. Plan over the downsampled (block mean) elevation map
+        coarse_costs = self.coarse_edge_costs(factor)
+        coarse_start = (min(start[0] // factor, coarse_rows - 1), min(start[1] // factor, coarse_cols - 1))
+        coarse_goal = (min(goal[0] // factor, coarse_rows - 1), min(goal[1] // factor, coarse_cols - 1))
+        coarse_path = grid_astar(coarse_costs, coarse_start, coarse_goal)
+        if not coarse_path:
+            return self.grid_astar(start, goal)
+
+        # 2. Build the full resolution corridor around the coarse path
+        coarse_mask = np.zeros((coarse_rows, coarse_cols), dtype=bool)
+        for row, col in coarse_path:
+            coarse_mask[
+                max(0, row - corridor) : row + corridor + 1, max(0, col - corridor) : col + corridor + 1
+            ] = True
+        mask = np.zeros((self.rows, self.cols), dtype=bool)
+        mask[: coarse_rows * factor, : coarse_cols * factor] = np.kron(
+            coarse_mask, np.ones((factor, factor), dtype=bool)
+        )
+        mask[start] = True
+        mask[goal] = True
+
+        # 3. Refine at full resolution inside the corridor (cropped to it, plus a 1 pixel margin
+        # so the roll neighbors of every corridor pixel are still real map data)
+        rows, cols = np.nonzero(mask)
+        row_off, col_off = max(0, rows.min() - 1), max(0, cols.min() - 1)
+        row_end, col_end = min(self.rows, rows.max() + 2), min(self.cols, cols.max() + 2)
+        if self.edge_costs is not None:
+            edge_costs = crop_edge_costs(self.edge_costs, row_off, row_end, col_off, col_end)
+        else:
+            edge_costs = compute_edge_costs(
+                self.elevation_data[row_off:row_end, col_off:col_end],
+                self.elev_cost,
+                self.elev_limit,
+                self.roll_cost,
+                self.roll_limit,
+            )
+        edge_costs[~mask[row_off:row_end, col_off:col_end]] = np.inf  # can't drive out of the corridor
+
+        path = grid_astar(
+            edge_costs, (start[0] - row_off, start[1] - col_off), (goal[0] - row_off, goal[1] - col_off)
+        )
+        if not path:
+            return self.grid_astar(start, goal)
+        return [(row + row_off, col + col_off) for row, col in path]
+
+    def coarse_edge_costs(self, factor=PYRAMID_FACTOR):
+        """
+        Edge costs over the downsampled (block mean) elevation map, cached per factor
+
+        Each coarse step covers factor pixels, so the limits scale up with it (same max slopes) and
+        the elevation and roll costs scale down with it (same weight relative to distance). That
+        makes factor times a coarse path cost roughly the full resolution cost of the same path.
+        """
+
+        if factor not in self.coarse_costs:
+            coarse_rows, coarse_cols = self.rows // factor, self.cols // factor
+            coarse_elevation = (
+                self.elevation_data[: coarse_rows * factor, : coarse_cols * factor]
+                .reshape(coarse_rows, factor, coarse_cols, factor)
+                .mean(axis=(1, 3))
+            )
+            self.coarse_costs[factor] = compute_edge_costs(
+                coarse_elevation,
+                self.elev_cost / factor,
+                self.elev_limit * factor,
+                self.roll_cost / factor,
+                self.roll_limit * factor,
+            )
+        return self.coarse_costs[factor]
+
+    def find_path(self, start, goal, grid_search=False, mode="standard"):
+        """
+        Runs the search selected by the planner options (see terrainPathPlanner)
+        """
+
+        if mode == "pyramid":
+            return self.pyramid_astar(start, goal)
+        elif mode != "standard":
+            raise Exception("Invalid terrain planner mode: " + str(mode))
+
+        if grid_search or self.edge_costs is not None:
+            return self.grid_astar(start, goal)
+        return self.astar(start, goal)
+
     def distance_between(self, n1, n2):
         # Simple Euclidean distance in pixel space
         d = math.sqrt((n1[0] - n2[0]) ** 2 + (n1[1] - n2[1]) ** 2)
@@ -103,28 +272,651 @@ class TerrainGraph(AStar):
         return cost
 
 
-def geopose_to_pixel(geopose, transform):
+def compute_edge_costs(elevation_data, elev_cost, elev_limit, roll_cost, roll_limit):
+    """
+    Builds the TerrainGraph edge cost for every pixel and direction at once with NumPy.
+
+    Returns a (rows, cols, 8) float64 array where [row, col, k] is the cost of moving from (row, col)
+    in DIRECTIONS[k]. Off-map moves and moves over the elevation or roll limits are set to inf.
+    The math matches TerrainGraph.distance_between to within float32 rounding (about 3e-7 on
+    float32 DEMs, since this works in float64 and distance_between in the DEM's dtype).
+    """
+
+    rows, cols = elevation_data.shape
+
+    # Roll differences between the left and right neighbors (0 where one of them is off the map)
+    # Horizontal moves look at (row, col - 1) and (row, col + 1)
+    roll_horiz = np.zeros((rows, cols))
+    roll_horiz[:, 1:-1] = np.abs(elevation_data[:, :-2] - elevation_data[:, 2:])
+    # Vertical moves look at (row - 1, col) and (row + 1, col)
+    roll_vert = np.zeros((rows, cols))
+    roll_vert[1:-1, :] = np.abs(elevation_data[:-2, :] - elevation_data[2:, :])
+    # Diagonal moves all look at (row, col - 1) and (row + 1, col)
+    roll_diag = np.zeros((rows, cols))
+    roll_diag[:-1, 1:] = np.abs(elevation_data[:-1, :-1] - elevation_data[1:, 1:])
+
+    edge_costs = np.full((rows, cols, len(DIRECTIONS)), np.inf)
+    for k, (dr, dc) in enumerate(DIRECTIONS):
+        # Slices of the pixels we move from and the pixels we move to (both on the map)
+        src = (slice(max(0, -dr), rows - max(0, dr)), slice(max(0, -dc), cols - max(0, dc)))
+        dst = (slice(max(0, dr), rows + min(0, dr)), slice(max(0, dc), cols + min(0, dc)))
+
+        if dr == 0:
+            roll_diff = roll_horiz[src]
+        elif dc == 0:
+            roll_diff = roll_vert[src]
+        else:
+            roll_diff = roll_diag[src]
+
+        elevation_diff = np.abs(elevation_data[src] - elevation_data[dst]).astype(np.float64)
+        cost = math.sqrt(dr**2 + dc**2) + elevation_diff * elev_cost + roll_diff * roll_cost
+
+        # If it's too steep (or the roll is too steep), report an infinite cost
+        cost[(elevation_diff > elev_limit) | (roll_diff > roll_limit)] = np.inf
+        edge_costs[src + (k,)] = cost
+
+    return edge_costs
+
+
+def crop_edge_costs(edge_costs, row_off, row_end, col_off, col_end):
+    """
+    Copies part of an edge cost grid, blocking the moves that would leave the cropped area.
+    """
+
+    cropped = np.array(edge_costs[row_off:row_end, col_off:col_end])
+    for k, (dr, dc) in enumerate(DIRECTIONS):
+        if dr < 0:
+            cropped[0, :, k] = np.inf
+        elif dr > 0:
+            cropped[-1, :, k] = np.inf
+        if dc < 0:
+            cropped[:, 0, k] = np.inf
+        elif dc > 0:
+            cropped[:, -1, k] = np.inf
+    return cropped
+
+
+def flat_costs(edge_costs):
+    """
+    Returns a flat memoryview over an edge cost grid for the searches to index
+
+    float32 (sidecar) and float64 grids are read in place, anything else is converted to float64.
+    """
+
+    edge_costs = np.asarray(edge_costs)
+    if edge_costs.dtype not in (np.float32, np.float64) or not edge_costs.dtype.isnative:
+        edge_costs = edge_costs.astype(np.float64)
+    flat = np.ascontiguousarray(edge_costs).reshape(-1)
+    return memoryview(flat).cast("B").cast(flat.dtype.char)  # memoryview can't index "<f" buffers
+
+
+def cost_sidecar_path(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit):
+    """
+    Returns the path of the precomputed edge cost sidecar for a map and set of cost parameters.
+    """
+
+    params = repr((float(elev_cost), float(elev_limit), float(roll_cost), float(roll_limit)))
+    params_hash = hashlib.sha1(params.encode()).hexdigest()[:12]
+    return os.path.splitext(geotiff_file)[0] + ".costs." + params_hash + ".npz"
+
+
+def save_cost_sidecar(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit):
+    """
+    Precomputes the edge costs for a map and saves them to its sidecar, returns the sidecar path.
+
+    The sidecar is an uncompressed .npz (so it can be memory-mapped) with the edge costs as float32
+    ("costs", inf where blocked, half the size of compute_edge_costs) and the blocked-cell mask
+    packed into one byte per pixel ("blocked", bit k is set if the move in DIRECTIONS[k] is
+    off the map or over a limit).
+    """
+
+    # https://rasterio.readthedocs.io/en/stable/quickstart.html#opening-a-dataset-in-reading-mode
+    with rasterio.open(geotiff_file) as src:
+        elevation_data = src.read(1)
+
+    edge_costs = compute_edge_costs(elevation_data, elev_cost, elev_limit, roll_cost, roll_limit)
+    blocked = np.packbits(np.isinf(edge_costs), axis=-1, bitorder="little")[:, :, 0]
+    sidecar_file = cost_sidecar_path(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+
+    # Write it next to the sidecar first, so the planner never maps a half written one
+    tmp_file = sidecar_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, costs=edge_costs.astype(np.float32), blocked=blocked)
+    os.replace(tmp_file, sidecar_file)
+    return sidecar_file
+
+
+def memmap_npz(npz_file):
+    """
+    Memory-maps every array in an uncompressed .npz file (np.load can't), returns a name -> array dict
+    """
+
+    arrays = {}
+    with zipfile.ZipFile(npz_file) as zf, open(npz_file, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith(".npy"):
+                raise ValueError("Can't memory-map " + info.filename + " in " + npz_file)
+
+            # The .npy data starts after the zip local file header (30 bytes, then the name and extra field)
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-4]] = np.memmap(
+                npz_file, dtype, "r", f.tell(), shape, "F" if fortran_order else "C"
+            )
+    return arrays
+
+
+def load_cost_sidecar(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, name="costs"):
+    """
+    Memory-maps the precomputed edge costs (or the "blocked" mask) for a map, or returns None if
+    there is no valid sidecar.
+    """
+
+    sidecar_file = cost_sidecar_path(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+    try:
+        # An older sidecar than the map itself is stale
+        if os.path.getmtime(sidecar_file) < os.path.getmtime(geotiff_file):
+            return None
+        return memmap_npz(sidecar_file)[name]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def grid_astar(edge_costs, start, goal):
+    """
+    A* search over a compute_edge_costs grid, specialized for 8-connected pixel grids.
+
+    Pixels are flat indices (row * cols + col) into preallocated g-score, parent and closed arrays,
+    and the open set is a binary heap of (f-score, index) pairs. Stale heap entries are skipped
+    when popped instead of being removed (the pixel distance heuristic is consistent, so closed
+    pixels never need to be reopened).
+
+    Returns the list of (row, col) pixels from start to goal, or None if there is no path.
+    """
+
+    rows, cols, num_dirs = edge_costs.shape
+    if start == goal:
+        return [start]
+
+    start_idx = start[0] * cols + start[1]
+    goal_idx = goal[0] * cols + goal[1]
+    goal_row, goal_col = goal
+
+    # Flat views and preallocated search state (one slot per pixel)
+    costs = flat_costs(edge_costs)
+    g_score = array("d", [math.inf]) * (rows * cols)
+    parent = array("q", [-1]) * (rows * cols)
+    closed = bytearray(rows * cols)
+
+    # Flat index offset and step length for each direction
+    moves = [(k, dr, dc, dr * cols + dc) for k, (dr, dc) in enumerate(DIRECTIONS)]
+
+    g_score[start_idx] = 0.0
+    open_heap = [
+        (math.sqrt((start[0] - goal_row) ** 2 + (start[1] - goal_col) ** 2), start_idx)
+    ]
+
+    while open_heap:
+        _, idx = heapq.heappop(open_heap)
+        if closed[idx]:
+            continue  # stale entry, this pixel was already expanded with a lower score
+
+        if idx == goal_idx:
+            # Walk the parents back to the start
+            path = []
+            while idx != -1:
+                path.append(divmod(idx, cols))
+                idx = parent[idx]
+            path.reverse()
+            return path
+
+        closed[idx] = 1
+        row, col = divmod(idx, cols)
+        g = g_score[idx]
+        base = idx * num_dirs
+
+        for k, dr, dc, offset in moves:
+            cost = costs[base + k]
+            if cost == math.inf:
+                continue  # off the map or too steep
+
+            n_idx = idx + offset
+            if closed[n_idx]:
+                continue
+
+            tentative = g + cost
+            if tentative >= g_score[n_idx]:
+                continue
+
+            g_score[n_idx] = tentative
+            parent[n_idx] = idx
+            n_row = row + dr - goal_row
+            n_col = col + dc - goal_col
+            heapq.heappush(open_heap, (tentative + math.sqrt(n_row * n_row + n_col * n_col), n_idx))
+
+    return None
+
+
+def multi_goal_dijkstra(edge_costs, start, goals):
+    """
+    Dijkstra search over a compute_edge_costs grid from one start to several goals at once.
+
+    Uses the same flat search state as grid_astar, but without a heuristic, so a single sweep
+    (stopping once every reachable goal has been expanded) finds the cheapest path to all of them.
+
+    Returns a list with the (row, col) pixel path to each goal, or None for unreachable goals.
+    """
+
+    rows, cols, num_dirs = edge_costs.shape
+    start_idx = start[0] * cols + start[1]
+    goal_idxs = [goal[0] * cols + goal[1] for goal in goals]
+    remaining = set(goal_idxs)
+
+    # Flat views and preallocated search state (one slot per pixel)
+    costs = flat_costs(edge_costs)
+    g_score = array("d", [math.inf]) * (rows * cols)
+    parent = array("q", [-1]) * (rows * cols)
+    closed = bytearray(rows * cols)
+    moves = [(k, dr * cols + dc) for k, (dr, dc) in enumerate(DIRECTIONS)]
+
+    g_score[start_idx] = 0.0
+    open_heap = [(0.0, start_idx)]
+    while open_heap and remaining:
+        g, idx = heapq.heappop(open_heap)
+        if closed[idx]:
+            continue  # stale entry, this pixel was already expanded with a lower score
+        closed[idx] = 1
+        remaining.discard(idx)
+
+        base = idx * num_dirs
+        for k, offset in moves:
+            cost = costs[base + k]
+            if cost == math.inf:
+                continue  # off the map or too steep
+
+            n_idx = idx + offset
+            tentative = g + cost
+            if closed[n_idx] or tentative >= g_score[n_idx]:
+                continue
+            g_score[n_idx] = tentative
+            parent[n_idx] = idx
+            heapq.heappush(open_heap, (tentative, n_idx))
+
+    paths = []
+    for idx in goal_idxs:
+        if not closed[idx]:
+            paths.append(None)
+            continue
+
+        # Walk the parents back to the start
+        path = []
+        while idx != -1:
+            path.append(divmod(idx, cols))
+            idx = parent[idx]
+        path.reverse()
+        paths.append(path)
+    return paths
+
+
+class IncrementalTerrainPlanner:
+    """
+    Incremental A* over an edge cost grid (Basic Moving Target D* Lite, Sun, Yeoh & Koenig 2010).
+    http://idm-lab.org/bib/abstracts/papers/aamas10a.pdf
+
+    Keeps its search tree (g and rhs values rooted at the start pixel) between plan() calls.
+    A shifted goal only re-keys the open set, a moved start (to a pixel the last search reached)
+    or changed edge costs (update_costs) only repair the part of the tree they affect. If a repair
+    turns out to cost more than a fresh search did (big changes), it gives up and starts over.
+    All search state lives in flat per-pixel arrays, like grid_astar. The bounding box of the
+    pixels the search has expanded is tracked (every other pixel with search state is a neighbor of
+    one), so moving the start only scans that box.
+    The edge costs can cover a window of a map (window is the rasterio Window they were read from).
+    """
+
+    def __init__(self, edge_costs, window=None):
+        self.rows, self.cols, self.num_dirs = edge_costs.shape
+        self.edge_costs = edge_costs
+        self.costs = flat_costs(edge_costs)
+        self.window = window if window is not None else Window(0, 0, self.cols, self.rows)
+        self.moves = [(k, dr * self.cols + dc) for k, (dr, dc) in enumerate(DIRECTIONS)]
+        self.lock = Lock()
+        self.start = None
+        self.goal = None
+        self.box = None  # [min row, max row, min col, max col] of the expanded pixels (and the start)
+        self.expanded = 0  # pixels expanded by the last plan() call
+        self.fresh_expanded = 0  # pixels expanded by the last fresh search (the repair budget)
+
+    def reset(self, start, goal):
+        """
+        Throws away the search tree and starts a fresh search from start to goal
+        """
+
+        num_pixels = self.rows * self.cols
+        self.g = array("d", [math.inf]) * num_pixels
+        self.rhs = array("d", [math.inf]) * num_pixels
+        self.stamp = array("q", [0]) * num_pixels  # matches the pixel's live open set entry
+        self.parent = array("q", [-1]) * num_pixels  # predecessor the pixel's rhs came from
+        self.queued = bytearray(num_pixels)
+        self.open_heap = []
+        self.km = 0.0
+        self.start, self.goal = start, goal
+        self.box = [start[0], start[0], start[1], start[1]]
+
+        start_idx = self.index(start)
+        self.rhs[start_idx] = 0.0
+        self.queue(start_idx)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the search state (the edge costs are shared with the graph entry)
+        """
+
+        nbytes = 0 if isinstance(self.edge_costs, np.memmap) else self.edge_costs.nbytes
+        if self.start is not None:
+            # g, rhs, stamp and parent (8 bytes each) and queued (1 byte) per pixel
+            nbytes += 33 * self.rows * self.cols
+        return nbytes
+
+    def index(self, pixel):
+        return pixel[0] * self.cols + pixel[1]
+
+    def heuristic(self, idx):
+        row, col = divmod(idx, self.cols)
+        return math.sqrt((row - self.goal[0]) ** 2 + (col - self.goal[1]) ** 2)
+
+    def key(self, idx):
+        best = min(self.g[idx], self.rhs[idx])
+        return (best + self.heuristic(idx) + self.km, best)
+
+    def queue(self, idx):
+        """
+        (Re)inserts an inconsistent pixel into the open set, or drops a consistent one from it
+        """
+
+        if self.g[idx] != self.rhs[idx]:
+            self.stamp[idx] += 1
+            self.queued[idx] = 1
+            k1, k2 = self.key(idx)
+            heapq.heappush(self.open_heap, (k1, k2, self.stamp[idx], idx))
+        else:
+            self.queued[idx] = 0  # any heap entries left for it are now stale
+
+    def update_rhs(self, idx):
+        """
+        Recomputes the one-step lookahead cost of a pixel from its predecessors
+        """
+
+        if idx == self.index(self.start):
+            self.rhs[idx] = 0.0
+            self.parent[idx] = -1
+        else:
+            best, best_pred = math.inf, -1
+            base = self.rows * self.cols
+            for k, offset in self.moves:
+                pred = idx - offset
+                if 0 <= pred < base:
+                    cost = self.costs[pred * self.num_dirs + k]
+                    if cost != math.inf and self.g[pred] + cost < best:
+                        best, best_pred = self.g[pred] + cost, pred
+            self.rhs[idx] = best
+            self.parent[idx] = best_pred
+        self.queue(idx)
+
+    def compute(self, budget=math.inf):
+        """
+        Expands inconsistent pixels until the goal's cost is final, returns False if over budget
+        """
+
+        goal_idx = self.index(self.goal)
+        goal_row, goal_col = self.goal
+        g, rhs, costs, num_dirs, cols = self.g, self.rhs, self.costs, self.num_dirs, self.cols
+        open_heap, queued, stamps, parent, km = self.open_heap, self.queued, self.stamp, self.parent, self.km
+        inf, sqrt, heappush, heappop = math.inf, math.sqrt, heapq.heappush, heapq.heappop
+        box = self.box  # expanded pixels (their successors are all within 1 pixel of it)
+        while open_heap:
+            k1, k2, stamp, idx = open_heap[0]
+            if not queued[idx] or stamp != stamps[idx]:
+                heappop(open_heap)  # stale entry
+                continue
+            if (k1, k2) >= self.key(goal_idx) and rhs[goal_idx] == g[goal_idx]:
+                break
+
+            heappop(open_heap)
+            best = min(g[idx], rhs[idx])
+            row, col = divmod(idx, cols)
+            new_k1 = best + sqrt((row - goal_row) ** 2 + (col - goal_col) ** 2) + km
+            if (k1, k2) < (new_k1, best):
+                # Key was computed with an older goal, put it back with the right one
+                stamps[idx] += 1
+                heappush(open_heap, (new_k1, best, stamps[idx], idx))
+                continue
+
+            queued[idx] = 0
+            self.expanded += 1
+            if self.expanded > budget:
+                return False
+            if row < box[0]:
+                box[0] = row
+            elif row > box[1]:
+                box[1] = row
+            if col < box[2]:
+                box[2] = col
+            elif col > box[3]:
+                box[3] = col
+            base = idx * num_dirs
+            if g[idx] > rhs[idx]:
+                # Overconsistent, lower its cost and let the successors use it
+                g_idx = g[idx] = rhs[idx]
+                for k, offset in self.moves:
+                    cost = costs[base + k]
+                    succ = idx + offset
+                    if cost != inf and g_idx + cost < rhs[succ]:
+                        rhs[succ] = g_idx + cost
+                        parent[succ] = idx
+                        if g[succ] != rhs[succ]:
+                            # Inlined queue(), this is the hot path of every search
+                            row, col = divmod(succ, cols)
+                            best = min(g[succ], rhs[succ])
+                            stamps[succ] += 1
+                            queued[succ] = 1
+                            heappush(
+                                open_heap,
+                                (
+                                    best + sqrt((row - goal_row) ** 2 + (col - goal_col) ** 2) + km,
+                                    best,
+                                    stamps[succ],
+                                    succ,
+                                ),
+                            )
+                        else:
+                            queued[succ] = 0
+            else:
+                # Underconsistent, its old cost is invalid so recompute it and its successors
+                g[idx] = inf
+                self.update_rhs(idx)
+                for k, offset in self.moves:
+                    if costs[base + k] != inf:
+                        self.update_rhs(idx + offset)
+        return True
+
+    def update_costs(self, edge_costs):
+        """
+        Swaps in a new edge cost grid (same shape), repairing the tree where the costs changed
+        """
+
+        with self.lock:
+            changed = np.argwhere(np.asarray(self.edge_costs) != np.asarray(edge_costs))
+            old_costs = self.costs
+            self.edge_costs = edge_costs
+            self.costs = flat_costs(edge_costs)
+            if self.start is None:
+                return
+
+            for row, col, k in changed:
+                idx = int(row) * self.cols + int(col)
+                flat = idx * self.num_dirs + int(k)
+                if old_costs[flat] != math.inf or self.costs[flat] != math.inf:
+                    self.update_rhs(idx + self.moves[k][1])
+
+    def move_start(self, start):
+        """
+        Re-roots the search tree at a new start pixel (Moving Target D* Lite)
+
+        Keeps the subtree hanging off the new start (shifting its costs so the new start is 0),
+        throws away the rest of the tree and re-queues the thrown away pixels along its border.
+        Only the touched bounding box (plus the 1 pixel of successors around it) is scanned.
+        """
+
+        # Views of the search state inside the touched box
+        row0, row1 = max(self.box[0] - 1, 0), min(self.box[1] + 2, self.rows)
+        col0, col1 = max(self.box[2] - 1, 0), min(self.box[3] + 2, self.cols)
+        box_rows, box_cols = row1 - row0, col1 - col0
+        shape, window = (self.rows, self.cols), (slice(row0, row1), slice(col0, col1))
+        g = np.frombuffer(self.g, dtype=np.float64).reshape(shape)[window]
+        rhs = np.frombuffer(self.rhs, dtype=np.float64).reshape(shape)[window]
+        parent = np.frombuffer(self.parent, dtype=np.int64).reshape(shape)[window]
+        queued = np.frombuffer(self.queued, dtype=np.uint8).reshape(shape)[window]
+        start_box = (start[0] - row0, start[1] - col0)
+
+        # Find every pixel whose parent chain runs through the new start (by pointer jumping, so
+        # it only takes log2(tree depth) passes over the box)
+        num_box = box_rows * box_cols
+        parent_rows, parent_cols = np.divmod(parent.reshape(-1), self.cols)
+        jump = np.where(
+            parent.reshape(-1) < 0, np.arange(num_box), (parent_rows - row0) * box_cols + parent_cols - col0
+        )
+        in_subtree = np.zeros(num_box, dtype=bool)
+        in_subtree[start_box[0] * box_cols + start_box[1]] = True
+        for _ in range(max(num_box, 2).bit_length()):
+            in_subtree |= in_subtree[jump]
+            next_jump = jump[jump]
+            if np.array_equal(next_jump, jump):
+                break
+            jump = next_jump
+        kept = in_subtree.reshape(box_rows, box_cols)
+
+        # Keep the subtree (relative to the new start), drop everything else the search touched
+        offset = g[start_box]
+        g[kept] -= offset
+        rhs[kept] -= offset
+        dropped = ~kept & ((g != math.inf) | (rhs != math.inf))
+        g[dropped] = math.inf
+        rhs[dropped] = math.inf
+        parent[dropped] = -1
+        queued[dropped] = 0
+        self.start = start
+        rhs[start_box] = g[start_box] = 0.0
+        parent[start_box] = -1
+
+        # The box shrinks to the kept subtree (and the open set), the re-queued pixels are next to it
+        rows, cols = np.nonzero(kept | (queued != 0))
+        self.box = [row0 + int(rows.min()), row0 + int(rows.max()), col0 + int(cols.min()), col0 + int(cols.max())]
+
+        # Dropped pixels next to the kept subtree can be reached from it again
+        near_kept = np.zeros_like(kept)
+        for dr, dc in DIRECTIONS:
+            near_kept[max(dr, 0):box_rows + min(dr, 0), max(dc, 0):box_cols + min(dc, 0)] |= kept[
+                max(-dr, 0):box_rows + min(-dr, 0), max(-dc, 0):box_cols + min(-dc, 0)
+            ]
+        for row, col in np.argwhere(dropped & near_kept).tolist():
+            self.update_rhs((row + row0) * self.cols + col + col0)
+
+        # The stored keys are all off by the cost offset now, so rebuild the open set from scratch
+        self.km = 0.0
+        self.open_heap = []
+        for row, col in np.argwhere(queued).tolist():
+            self.queue((row + row0) * self.cols + col + col0)
+
+    def plan(self, start, goal):
+        """
+        Returns the list of (row, col) pixels from start to goal (or None), reusing the last search
+        """
+
+        with self.lock:
+            self.expanded = 0
+            fresh = self.start is None or (start != self.start and self.g[self.index(start)] == math.inf)
+            if fresh:
+                # Nothing useful to reuse, start over
+                self.reset(start, goal)
+            else:
+                if goal != self.goal:
+                    # Keys can only have been underestimated by the distance the goal moved
+                    self.km += math.sqrt((goal[0] - self.goal[0]) ** 2 + (goal[1] - self.goal[1]) ** 2)
+                    self.goal = goal
+                if start != self.start:
+                    self.move_start(start)
+
+            if not fresh and not self.compute(budget=max(self.fresh_expanded, MIN_REPAIR_BUDGET)):
+                # Repairing is taking longer than searching from scratch did
+                self.reset(start, goal)
+                fresh = True
+            if fresh:
+                self.compute()
+                self.fresh_expanded = self.expanded
+            return self.extract_path()
+
+    def extract_path(self):
+        """
+        Follows the cheapest predecessors back from the goal to the start
+        """
+
+        start_idx, idx = self.index(self.start), self.index(self.goal)
+        if self.g[idx] == math.inf:
+            return None
+
+        path = [divmod(idx, self.cols)]
+        base = self.rows * self.cols
+        while idx != start_idx:
+            best, best_pred = math.inf, None
+            for k, offset in self.moves:
+                pred = idx - offset
+                if 0 <= pred < base:
+                    cost = self.costs[pred * self.num_dirs + k]
+                    if cost != math.inf and self.g[pred] + cost < best:
+                        best, best_pred = self.g[pred] + cost, pred
+            if best_pred is None or len(path) > base:
+                return None  # shouldn't happen with a consistent tree, but don't loop forever
+            idx = best_pred
+            path.append(divmod(idx, self.cols))
+        path.reverse()
+        return path
+
+
+def geopose_to_pixel(geopose, transform, frame):
     """
     Converts a geographic_msgs/GeoPose to pixel coordinates.
     """
 
     lat = geopose.position.latitude
     lon = geopose.position.longitude
-    east, north, zone_number, zone_letter = utm.from_latlon(lat, lon)
+    return frame.latlon_to_pixel(lat, lon, transform)
+
+
+def utm_to_pixel(east, north, transform):
+    """
+    Converts UTM coordinates to pixel coordinates.
+    """
+
     # https://rasterio.readthedocs.io/en/stable/api/rasterio.transform.html#rasterio.transform.rowcol
     row, col = rowcol(transform, east, north)
-    row, col = int(round(row)), int(round(col))
-    return (row, col), (zone_number, zone_letter)
+    return int(round(row)), int(round(col))
 
 
-def pixel_to_geopose(pixel_coords, transform, utm_zone):
+def pixel_to_geopose(pixel_coords, transform, frame):
     """
     Converts pixel coordinates back to a geographic_msgs/GeoPose.
     """
 
     row, col = pixel_coords
     east, north = transform * (col + 0.5, row + 0.5)  # Use pixel center
-    lat, lon = utm.to_latlon(east, north, utm_zone[0], utm_zone[1])
+    lat, lon = frame.utm_to_latlon(east, north)
     new_geopose = GeoPose()
     new_geopose.position = GeoPoint()
     new_geopose.position.latitude = lat
@@ -160,70 +952,780 @@ def downsample_points(num_points, des_dist):
     return sorted(list(selected_indices_set))
 
 
-def terrainPathPlanner(start_geopose, end_geopose, wp_dist, elev_cost, elev_limit, roll_cost, roll_limit):
+class MapFootprintIndex:
+    """
+    Bounding box index over the GeoTIFF maps in the maps folder.
+
+    Map footprints (transform and size) are persisted to a sidecar file in the maps folder and only
+    re-read from the GeoTIFFs that were added or changed since (by modification time and size).
+    Lookups hash the UTM location into a grid of MAP_INDEX_CELL_SIZE cells, so finding the covering
+    map only checks the few maps that overlap that cell instead of every map in the folder.
+    """
+
+    def __init__(self, geotiff_path=GEOTIFF_PATH):
+        self.geotiff_path = geotiff_path
+        self.index_file = os.path.join(geotiff_path, MAP_INDEX_FILE)
+        self.maps = []  # (geotiff_file, transform, height, width)
+        self.files = {}  # geotiff_file -> index into self.maps
+        self.grid = {}  # (cell_x, cell_y) -> list of indices into self.maps
+
+    def refresh(self):
+        """
+        Brings the index up to date with the maps folder, returns the maps that changed (or are gone)
+        """
+
+        # Load the last saved index (if we have one)
+        saved = {}
+        try:
+            with open(self.index_file) as f:
+                saved = {entry["file"]: entry for entry in json.load(f)["maps"]}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        entries = []
+        changed = set()
+        geotiff_files = sorted(f for f in os.listdir(self.geotiff_path) if f.endswith(".tif"))
+        for file in geotiff_files:
+            stat = os.stat(os.path.join(self.geotiff_path, file))
+            entry = saved.get(file)
+            if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                # https://rasterio.readthedocs.io/en/stable/quickstart.html#opening-a-dataset-in-reading-mode
+                with rasterio.open(os.path.join(self.geotiff_path, file)) as src:
+                    entry = {
+                        "file": file,
+                        "mtime": stat.st_mtime,
+                        "size": stat.st_size,
+                        "transform": list(src.transform)[:6],
+                        "height": src.height,
+                        "width": src.width,
+                    }
+                changed.add(os.path.join(self.geotiff_path, file))
+            entries.append(entry)
+        for file in set(saved) - set(geotiff_files):
+            changed.add(os.path.join(self.geotiff_path, file))
+
+        if changed:
+            try:
+                with open(self.index_file, "w") as f:
+                    json.dump({"maps": entries}, f, indent=2)
+            except OSError:
+                pass  # read-only maps folder, just keep the index in memory
+
+        self.build(entries)
+        return changed
+
+    def build(self, entries):
+        """
+        Builds the in-memory map list and grid from index entries
+        """
+
+        maps = []
+        files = {}
+        grid = {}
+        for i, entry in enumerate(entries):
+            transform = rasterio.Affine(*entry["transform"])
+            height, width = entry["height"], entry["width"]
+            maps.append((os.path.join(self.geotiff_path, entry["file"]), transform, height, width))
+            files[maps[-1][0]] = i
+
+            # Add the map to every grid cell its bounding box touches
+            x0, y0 = transform * (0, 0)
+            x1, y1 = transform * (width, height)
+            cell_x0, cell_y0 = self.cell(min(x0, x1), min(y0, y1))
+            cell_x1, cell_y1 = self.cell(max(x0, x1), max(y0, y1))
+            for cell_x in range(cell_x0, cell_x1 + 1):
+                for cell_y in range(cell_y0, cell_y1 + 1):
+                    grid.setdefault((cell_x, cell_y), []).append(i)
+
+        # Swap the new index in at once, so lookups never see a half built one
+        self.maps, self.files, self.grid = maps, files, grid
+
+    def footprint(self, geotiff_file):
+        """
+        Returns the (transform, height, width) of an indexed map
+        """
+
+        return self.maps[self.files[geotiff_file]][1:]
+
+    def cell(self, east, north):
+        return int(math.floor(east / MAP_INDEX_CELL_SIZE)), int(math.floor(north / MAP_INDEX_CELL_SIZE))
+
+    def find_map(self, start_geopose, end_geopose, frame=None):
+        """
+        Returns the first map that includes both the start and end locations (or None)
+        """
+
+        if frame is None:
+            frame = MissionFrame.from_geopose(start_geopose)
+        start_east, start_north = frame.latlon_to_utm(
+            start_geopose.position.latitude, start_geopose.position.longitude
+        )
+        end_east, end_north = frame.latlon_to_utm(
+            end_geopose.position.latitude, end_geopose.position.longitude
+        )
+
+        for i in self.grid.get(self.cell(start_east, start_north), []):
+            geotiff_file, transform, height, width = self.maps[i]
+            start_pixel = utm_to_pixel(start_east, start_north, transform)
+            end_pixel = utm_to_pixel(end_east, end_north, transform)
+            if 0 <= start_pixel[0] < height and 0 <= start_pixel[1] < width:
+                if 0 <= end_pixel[0] < height and 0 <= end_pixel[1] < width:
+                    return geotiff_file
+        return None
+
+
+def available_memory_mb():
+    """
+    Returns the memory available for new allocations (MemAvailable in /proc/meminfo, in MB), or
+    None if it can't be read
+    """
+
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class TerrainMapCache:
+    """
+    Process-wide cache of GeoTIFF map footprints, decoded elevation data and TerrainGraphs.
+
+    The maps folder is indexed with a MapFootprintIndex at startup (and again when a lookup misses,
+    at most every MAP_INDEX_REFRESH_PERIOD, to pick up new maps), so finding the map that covers a
+    leg doesn't touch the disk. Decoded elevation arrays and TerrainGraphs (with their
+    precomputed edge costs) are kept in an LRU cache limited to max_size_mb, so repeated plans over
+    the same map skip both the GeoTIFF read and the edge cost precompute. Entry sizes are counted
+    again on every lookup, since graphs grow their edge cost grids after they're cached.
+
+    max_size_mb is capped to MAP_CACHE_MEMORY_FRACTION of the memory available when it's created,
+    and each worker process (see get_cost_pool and get_plan_pool) has its own cache.
+    """
+
+    def __init__(self, geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+        self.geotiff_path = geotiff_path
+        available_mb = available_memory_mb()
+        if available_mb is not None:
+            max_size_mb = min(max_size_mb, int(available_mb * MAP_CACHE_MEMORY_FRACTION))
+        self.max_size = max_size_mb * 1024 * 1024
+        self.map_index = MapFootprintIndex(geotiff_path)
+        self.cache = OrderedDict()  # key -> (value, nbytes), most recently used last
+        self.cache_size = 0
+        self.lock = Lock()
+        self.index_time = 0.0
+        self.index_maps()
+
+    def index_maps(self):
+        """
+        Refreshes the map footprint index (dropping cached data for any maps that changed)
+        """
+
+        with self.lock:
+            self.index_time = time.monotonic()
+            changed = self.map_index.refresh()
+            for key in [key for key in self.cache if key[1] in changed]:
+                del self.cache[key]
+            self._trim()
+
+    def find_map(self, start_geopose, end_geopose, frame=None):
+        """
+        Returns the first map that includes both the start and end locations (or None)
+        """
+
+        geotiff_file = self.map_index.find_map(start_geopose, end_geopose, frame)
+        if geotiff_file is None and time.monotonic() - self.index_time > MAP_INDEX_REFRESH_PERIOD:
+            # A map might have been added to the folder since we last looked
+            self.index_maps()
+            geotiff_file = self.map_index.find_map(start_geopose, end_geopose, frame)
+        return geotiff_file
+
+    def lookup(self, key):
+        """
+        Returns a cached entry (marking it as the most recently used) or None on a miss
+        """
+
+        with self.lock:
+            if key not in self.cache:
+                return None
+            self.cache.move_to_end(key)
+            self._trim()  # the newest entry is never evicted
+            return self.cache[key][0]
+
+    def get_window(self, geotiff_file, window):
+        """
+        Returns the elevation data inside a rasterio Window of a map
+
+        Slices the cached elevation data if we have it, otherwise only reads the window from disk.
+        """
+
+        cached = self.lookup(("elevation", geotiff_file))
+        if cached is not None:
+            return cached[0][window.toslices()]
+
+        # https://rasterio.readthedocs.io/en/stable/topics/windowed-rw.html
+        with rasterio.open(geotiff_file) as src:
+            return src.read(1, window=window)
+
+    def get_elevation(self, geotiff_file):
+        """
+        Returns the (elevation_data, transform) for a map, reading it from disk on a cache miss
+        """
+
+        key = ("elevation", geotiff_file)
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        # https://rasterio.readthedocs.io/en/stable/quickstart.html#opening-a-dataset-in-reading-mode
+        with rasterio.open(geotiff_file) as src:
+            value = (src.read(1), src.transform)
+
+        self._insert(key, value, value[0].nbytes)
+        return value
+
+    def get_graph(self, geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, precompute=False):
+        """
+        Returns a TerrainGraph for a map and set of cost parameters, building it on a cache miss
+        """
+
+        key = ("graph", geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, precompute)
+        graph = self.lookup(key)
+        if graph is not None:
+            return graph
+
+        elevation_data, transform = self.get_elevation(geotiff_file)
+        edge_costs = self.get_sidecar(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+        graph = TerrainGraph(
+            elevation_data, transform, elev_cost, elev_limit, roll_cost, roll_limit, precompute, edge_costs
+        )
+
+        self._insert(key, graph)  # sized by graph.nbytes
+        return graph
+
+    def get_window_graph(self, geotiff_file, window, elev_cost, elev_limit, roll_cost, roll_limit, precompute=False):
+        """
+        Returns a TerrainGraph for a rasterio Window of a map (not cached, windows change every leg)
+        """
+
+        edge_costs = self.get_sidecar(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+        if edge_costs is not None:
+            row_end, col_end = window.row_off + window.height, window.col_off + window.width
+            edge_costs = crop_edge_costs(edge_costs, window.row_off, row_end, window.col_off, col_end)
+
+        transform, _, _ = self.map_index.footprint(geotiff_file)
+        return TerrainGraph(
+            self.get_window(geotiff_file, window),
+            transform,
+            elev_cost,
+            elev_limit,
+            roll_cost,
+            roll_limit,
+            precompute,
+            edge_costs,
+        )
+
+    def get_sidecar(self, geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit):
+        """
+        Memory-maps the precomputed edge costs for a map if it has an up-to-date sidecar (or None)
+
+        Used whenever one exists, whatever the precompute setting, since it costs nothing to load.
+        """
+
+        edge_costs = load_cost_sidecar(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+        _, height, width = self.map_index.footprint(geotiff_file)
+        if edge_costs is None or edge_costs.shape != (height, width, len(DIRECTIONS)):
+            return None
+        return edge_costs
+
+    def get_incremental_planner(self, geotiff_file, window, elev_cost, elev_limit, roll_cost, roll_limit, needed=None):
+        """
+        Returns the IncrementalTerrainPlanner for a map and set of cost parameters, so its search
+        tree survives between legs (and between replans of the same leg)
+
+        The cached planner is reused if its window covers the needed window (by default, all of
+        window), otherwise it's replaced by a new planner over window (costs read like get_window_graph).
+        """
+
+        key = ("incremental", geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+        planner = self.lookup(key)
+        if planner is not None and window_covers(planner.window, needed if needed is not None else window):
+            return planner
+
+        graph = self.get_window_graph(geotiff_file, window, elev_cost, elev_limit, roll_cost, roll_limit, True)
+        planner = IncrementalTerrainPlanner(graph.edge_costs, window)
+        self._insert(key, planner)  # sized by planner.nbytes
+        return planner
+
+    def _insert(self, key, value, nbytes=0):
+        """
+        Adds an entry, evicting the least recently used ones to stay under the size limit
+
+        Values with an nbytes attribute (TerrainGraphs, IncrementalTerrainPlanners) are sized by it
+        whenever the cache is trimmed, the others by the nbytes given here.
+        """
+
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = (value, nbytes)
+            self._trim()
+
+    def _trim(self):
+        """
+        Recounts the entry sizes and evicts the least recently used ones to stay under the size
+        limit (always keeping the newest entry, even if it's bigger than the limit on its own)
+        """
+
+        sizes = [getattr(value, "nbytes", nbytes) for value, nbytes in self.cache.values()]
+        self.cache_size = sum(sizes)
+        for size in sizes:
+            if self.cache_size <= self.max_size or len(self.cache) <= 1:
+                break
+            self.cache.popitem(last=False)
+            self.cache_size -= size
+
+
+_map_cache = None
+_map_cache_lock = Lock()
+
+
+def get_map_cache(geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+    """
+    Returns the process-wide TerrainMapCache, creating (and indexing) it on the first call
+    """
+
+    global _map_cache
+    with _map_cache_lock:
+        if _map_cache is None:
+            _map_cache = TerrainMapCache(geotiff_path, max_size_mb)
+        return _map_cache
+
+
+_cost_pool = None
+
+
+def cost_pool_workers():
+    """
+    Returns how many worker processes the cost pool gets (COST_POOL_WORKERS, leaving a core for the
+    node). With fewer than 2, the sweeps run in this process instead.
+    """
+
+    return max(1, min(COST_POOL_WORKERS, (os.cpu_count() or 1) - 1))
+
+
+def get_cost_pool(geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+    """
+    Returns the process-wide worker pool for leg_cost_sweep, creating it on the first call
+
+    Workers are spawned (not forked) since the state machine node runs a multi-threaded executor.
+    Each one indexes the maps into its own TerrainMapCache when it starts, and keeps the coarse
+    edge costs it computes there, so sweeps only send the map name and pixels to the workers.
+    They only hold elevation data and coarse costs, so they split max_size_mb between them.
+    """
+
+    global _cost_pool
+    with _map_cache_lock:
+        if _cost_pool is None:
+            _cost_pool = ProcessPoolExecutor(
+                cost_pool_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_map_cache,
+                initargs=(geotiff_path, max(1, max_size_mb // cost_pool_workers())),
+            )
+        return _cost_pool
+
+
+def warm_cost_pool(elev_cost, elev_limit, roll_cost, roll_limit, factor=PYRAMID_FACTOR, geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+    """
+    Starts the cost pool workers ahead of time (at node startup), so terrainCostMatrix doesn't wait
+    on spawning them and loading the maps. Returns the futures of the warm up jobs (none if the
+    sweeps run in this process).
+    """
+
+    if cost_pool_workers() < 2:
+        return []
+    pool = get_cost_pool(geotiff_path, max_size_mb)
+    params = (elev_cost, elev_limit, roll_cost, roll_limit, factor)
+    return [pool.submit(warm_cost_worker, *params) for _ in range(cost_pool_workers())]
+
+
+def warm_cost_worker(elev_cost, elev_limit, roll_cost, roll_limit, factor=PYRAMID_FACTOR):
+    """
+    Computes the coarse edge costs of every indexed map in this process's TerrainMapCache
+    """
+
+    map_cache = get_map_cache()
+    for geotiff_file, _, height, width in map_cache.map_index.maps:
+        if height // factor >= 2 and width // factor >= 2:
+            map_cache.get_graph(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit).coarse_edge_costs(factor)
+
+
+_plan_pool = None
+
+
+def get_plan_pool(geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+    """
+    Returns the process-wide single worker pool for background terrainPathPlanner calls, creating
+    it on the first call
+
+    Spawned like the cost pool, and its worker indexes the maps into its own TerrainMapCache when it
+    starts, so background plans don't hold this process's GIL or touch its terrain graphs.
+    """
+
+    global _plan_pool
+    with _map_cache_lock:
+        if _plan_pool is None:
+            _plan_pool = ProcessPoolExecutor(
+                1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_map_cache,
+                initargs=(geotiff_path, max_size_mb),
+            )
+        return _plan_pool
+
+
+def warm_plan_pool(geotiff_path=GEOTIFF_PATH, max_size_mb=MAP_CACHE_SIZE_MB):
+    """
+    Starts the plan pool worker ahead of time (at node startup) and has it read the maps, so the
+    first background plan doesn't wait on either. Returns the future of the warm up job.
+    """
+
+    return get_plan_pool(geotiff_path, max_size_mb).submit(warm_plan_worker)
+
+
+def warm_plan_worker():
+    """
+    Reads the elevation of every indexed map into this process's TerrainMapCache (the least
+    recently used are dropped again if they don't all fit)
+    """
+
+    map_cache = get_map_cache()
+    for geotiff_file, _, _, _ in map_cache.map_index.maps:
+        map_cache.get_elevation(geotiff_file)
+
+
+def leg_cost_sweep(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, factor, source, goals):
+    """
+    Returns the cheapest path cost over a map's coarse edge costs from source to each goal (in
+    coarse pixels, None if unreachable). Runs in a cost pool worker, or in this process.
+    """
+
+    graph = get_map_cache().get_graph(geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit)
+    edge_costs = graph.coarse_edge_costs(factor)
+    costs = []
+    for path in multi_goal_dijkstra(edge_costs, source, goals):
+        if path is None:
+            costs.append(None)
+            continue
+        cost = 0.0
+        for (row, col), (next_row, next_col) in zip(path, path[1:]):
+            cost += float(edge_costs[row, col, DIRECTION_INDEX[(next_row - row, next_col - col)]])
+        costs.append(cost)
+    return costs
+
+
+def terrainCostMatrix(geoposes, fallback, elev_cost, elev_limit, roll_cost, roll_limit, factor=PYRAMID_FACTOR, parallel=True, frame=None):
+    """
+    Terrain traversal costs between GPS locations, for ordering the task legs
+
+    Runs one multi-goal Dijkstra sweep (leg_cost_sweep) from each location over the coarse (pyramid)
+    edge costs of the map it shares with the others, in parallel across the cost pool workers
+    (start them with warm_cost_pool). These are coarse costs scaled back up by factor, not the
+    cost of the full resolution path. Sweeps are cached in the TerrainMapCache, so ordering the
+    same legs again doesn't plan anything.
+    Pairs that aren't on a common map, or that the coarse map can't connect, keep their cost from
+    the fallback matrix, and no cost is ever less than the fallback (straight line) cost.
+    """
+
+    map_cache = get_map_cache()
+    matrix = np.array(fallback, dtype=np.float64)
+    if frame is None:
+        frame = MissionFrame.from_geopose(geoposes[0])
+
+    # Group the targets of each source by the map they share
+    targets = {}  # (geotiff_file, source index) -> target indices
+    for i, source_geopose in enumerate(geoposes):
+        for j, target_geopose in enumerate(geoposes):
+            if i != j:
+                geotiff_file = map_cache.find_map(source_geopose, target_geopose, frame)
+                if geotiff_file:
+                    targets.setdefault((geotiff_file, i), []).append(j)
+
+    # Look up the cached sweeps and collect the ones we still have to run
+    sweeps = []  # (key, source index, target indices, leg_cost_sweep arguments)
+    results = {}
+    for (geotiff_file, i), js in targets.items():
+        transform, height, width = map_cache.map_index.footprint(geotiff_file)
+        rows, cols = height // factor, width // factor
+        if rows < 2 or cols < 2:
+            continue  # map is too small to downsample
+        coarse = []
+        for k in [i] + js:
+            row, col = geopose_to_pixel(geoposes[k], transform, frame)
+            coarse.append((min(row // factor, rows - 1), min(col // factor, cols - 1)))
+
+        key = ("leg_costs", geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, factor, coarse[0], tuple(coarse[1:]))
+        sweep_costs = map_cache.lookup(key)
+        if sweep_costs is not None:
+            results[(i, tuple(js))] = sweep_costs
+            continue
+        params = (elev_cost, elev_limit, roll_cost, roll_limit, factor)
+        sweeps.append((key, i, js, (geotiff_file,) + params + (coarse[0], coarse[1:])))
+
+    if sweeps:
+        args = list(zip(*[sweep_args for _, _, _, sweep_args in sweeps]))
+        if parallel and len(sweeps) > 1 and cost_pool_workers() > 1:
+            costs = list(get_cost_pool(map_cache.geotiff_path, map_cache.max_size // (1024 * 1024)).map(leg_cost_sweep, *args))
+        else:
+            costs = list(map(leg_cost_sweep, *args))
+        for (key, i, js, _), sweep_costs in zip(sweeps, costs):
+            map_cache._insert(key, sweep_costs, 0)
+            results[(i, tuple(js))] = sweep_costs
+
+    # Coarse costs are in coarse cells, factor of them make up the full resolution cost
+    for (i, js), sweep_costs in results.items():
+        for j, cost in zip(js, sweep_costs):
+            if cost is not None:
+                matrix[i, j] = max(matrix[i, j], cost * factor)
+    return matrix
+
+
+def corridor_window(start_pixel, end_pixel, padding, height, width):
+    """
+    Returns a rasterio Window around the start and end pixels, padded and clipped to the map
+    """
+
+    return bounding_window([start_pixel, end_pixel], padding, height, width)
+
+
+def bounding_window(pixels, padding, height, width):
+    """
+    Returns a rasterio Window around a set of pixels, padded and clipped to the map
+    """
+
+    row_off = max(0, min(row for row, _ in pixels) - padding)
+    col_off = max(0, min(col for _, col in pixels) - padding)
+    row_end = min(height, max(row for row, _ in pixels) + padding + 1)
+    col_end = min(width, max(col for _, col in pixels) + padding + 1)
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+
+def window_covers(outer, inner):
+    """
+    Checks if a rasterio Window lies entirely inside another one
+    """
+
+    return (
+        outer.row_off <= inner.row_off
+        and outer.col_off <= inner.col_off
+        and inner.row_off + inner.height <= outer.row_off + outer.height
+        and inner.col_off + inner.width <= outer.col_off + outer.width
+    )
+
+
+def touches_window_edge(path_pixels, window, height, width):
+    """
+    Checks if a path (in window pixels) runs along a window edge that isn't also the map edge
+    """
+
+    for row, col in path_pixels:
+        if row == 0 and window.row_off > 0:
+            return True
+        if col == 0 and window.col_off > 0:
+            return True
+        if row == window.height - 1 and window.row_off + window.height < height:
+            return True
+        if col == window.width - 1 and window.col_off + window.width < width:
+            return True
+    return False
+
+
+def terrainPathPlanner(start_geopose, end_geopose, wp_dist, elev_cost, elev_limit, roll_cost, roll_limit, precompute=False, grid_search=False, window_padding=0.0, mode="standard", frame=None):
     """
     Generate intermediary waypoints between two GPS coordinates with terrain consideration
 
+    Set precompute (or grid_search, they're the same) to build the full edge cost grid up front and
+    search it with the flat-array grid_astar instead of python-astar (faster, uses more memory).
+    Set window_padding (in meters) to only plan inside a window around the start and end locations.
+    The window doubles in size whenever the path runs along its edge (or no path is found inside it).
+    Set mode to "pyramid" to plan coarse-to-fine (see TerrainGraph.pyramid_astar) instead of over
+    every full resolution pixel ("standard"), or "incremental" to keep the search tree between calls
+    and only repair it when the start or goal moves (see IncrementalTerrainPlanner, it keeps its
+    window while the start and end stay well inside it).
+    Maps, elevation data and graphs come from the process-wide TerrainMapCache, and precomputed
+    edge cost sidecars (see precompute_terrain_costs) are memory-mapped and searched with grid_astar
+    whenever they exist, whatever the precompute setting. Coordinates are converted in the task's
+    MissionFrame (or one anchored at the start location if none is given).
+
     :author: Nelson Durrant
     :date: Apr 2025
     """
 
-    # NOTE: You can add a new GeoTIFF map by adding a file from this link to the maps folder:
-    # https://portal.opentopography.org/raster?opentopoID=OTNED.012021.4269.3
-
-    geotiff_file = None
-    geotiff_path = (
-        "/home/marsrover-docker/rover_ws/src/rover_navigation/rover_navigation/maps"
-    )
+    map_cache = get_map_cache()
+    if frame is None:
+        frame = MissionFrame.from_geopose(start_geopose)
 
     # Check all of our maps to see if we have a valid one
-    geotiff_files = [f for f in os.listdir(geotiff_path) if f.endswith(".tif")]
-    for file in geotiff_files:
-        # https://rasterio.readthedocs.io/en/stable/quickstart.html#opening-a-dataset-in-reading-mode
-        with rasterio.open(os.path.join(geotiff_path, file)) as src:
-            transform = src.transform
-
-            # Is our current location included in the map?
-            start_pixel, _ = geopose_to_pixel(start_geopose, transform)
-            end_pixel, _ = geopose_to_pixel(end_geopose, transform)
-            if 0 <= start_pixel[0] < src.height and 0 <= start_pixel[1] < src.width:
-                if 0 <= end_pixel[0] < src.height and 0 <= end_pixel[1] < src.width:
-                    # We found a valid map!
-                    geotiff_file = os.path.join(geotiff_path, file)
-                    break
-
+    geotiff_file = map_cache.find_map(start_geopose, end_geopose, frame)
     if not geotiff_file:
         raise Exception("No viable map found for terrain-based planning")
+    transform, height, width = map_cache.map_index.footprint(geotiff_file)
 
-    # https://rasterio.readthedocs.io/en/stable/quickstart.html#opening-a-dataset-in-reading-mode
-    with rasterio.open(geotiff_file) as src:
-        elevation_data = src.read(1)
-        transform = src.transform
+    # Convert to the pixel space
+    start_pixel = geopose_to_pixel(start_geopose, transform, frame)
+    end_pixel = geopose_to_pixel(end_geopose, transform, frame)
 
-        # Convert to the pixel space
-        start_pixel, start_utm_zone = geopose_to_pixel(start_geopose, transform)
-        end_pixel, _ = geopose_to_pixel(end_geopose, transform)
-        utm_zone = start_utm_zone
+    if mode == "incremental":
+        # Reuse the last search (see IncrementalTerrainPlanner), if its window still covers the start
+        # and end with half the padding around them. A new window gets the full padding, so nearby
+        # replans (like the hex points) keep reusing it.
+        if window_padding > 0:
+            padding = int(math.ceil(window_padding / abs(transform.a)))
+            window = corridor_window(start_pixel, end_pixel, padding, height, width)
+            needed = corridor_window(start_pixel, end_pixel, padding // 2, height, width)
+        else:
+            window = needed = Window(0, 0, width, height)
+        while True:
+            planner = map_cache.get_incremental_planner(
+                geotiff_file, window, elev_cost, elev_limit, roll_cost, roll_limit, needed
+            )
+            offset = (planner.window.row_off, planner.window.col_off)
+            path_pixels = planner.plan(
+                (start_pixel[0] - offset[0], start_pixel[1] - offset[1]),
+                (end_pixel[0] - offset[0], end_pixel[1] - offset[1]),
+            )
 
+            if planner.window.height == height and planner.window.width == width:
+                break  # the window is the whole map, it can't grow any more
+            if path_pixels and not touches_window_edge(path_pixels, planner.window, height, width):
+                break
+            padding *= 2
+            window = needed = corridor_window(start_pixel, end_pixel, padding, height, width)
+
+        if path_pixels:
+            path_pixels = [(row + offset[0], col + offset[1]) for row, col in path_pixels]
+    elif window_padding > 0:
+        # Only read and plan over a window around the start and end, growing it as needed
+        padding = int(math.ceil(window_padding / abs(transform.a)))
+        while True:
+            window = corridor_window(start_pixel, end_pixel, padding, height, width)
+            terrain_graph = map_cache.get_window_graph(
+                geotiff_file,
+                window,
+                elev_cost,
+                elev_limit,
+                roll_cost,
+                roll_limit,
+                precompute or grid_search,
+            )
+
+            # Initialize and run A* (in window pixels)
+            offset = (window.row_off, window.col_off)
+            window_start = (start_pixel[0] - offset[0], start_pixel[1] - offset[1])
+            window_end = (end_pixel[0] - offset[0], end_pixel[1] - offset[1])
+            path_pixels = terrain_graph.find_path(window_start, window_end, grid_search, mode)
+            path_pixels = list(path_pixels) if path_pixels else None
+
+            if window.height == height and window.width == width:
+                break  # the window is the whole map, it can't grow any more
+            if path_pixels and not touches_window_edge(path_pixels, window, height, width):
+                break
+            padding *= 2
+
+        if path_pixels:
+            path_pixels = [(row + offset[0], col + offset[1]) for row, col in path_pixels]
+    else:
         # Initialize and run A*
-        terrain_graph = TerrainGraph(elevation_data, transform, elev_cost, elev_limit, roll_cost, roll_limit)
-        path_pixels = terrain_graph.astar(start_pixel, end_pixel)
-        if not path_pixels:
-            raise Exception("No viable path found by terrain-based AStar planner")
-
-        # Convert pixel path to GeoPose path
-        path_geoposes = []
-        for pixel in path_pixels:
-            gp = pixel_to_geopose(pixel, transform, utm_zone)
-            path_geoposes.append(gp)
-        path_geoposes[-1] = end_geopose
-
-        # Downsample the path to evenly spaced waypoints
-        final_path_result = path_geoposes
-        num_points = len(path_geoposes)
-        if num_points >= 2:
-            selected_indices = downsample_points(num_points, wp_dist)
-            downsampled_geoposes = [path_geoposes[i] for i in selected_indices]
-            final_path_result = downsampled_geoposes
-
-        return final_path_result
+        terrain_graph = map_cache.get_graph(
+            geotiff_file, elev_cost, elev_limit, roll_cost, roll_limit, precompute or grid_search
+        )
+        path_pixels = terrain_graph.find_path(start_pixel, end_pixel, grid_search, mode)
+        path_pixels = list(path_pixels) if path_pixels else None
+    if not path_pixels:
+        raise Exception("No viable path found by terrain-based AStar planner")
+
+    return pixel_path_to_waypoints(path_pixels, transform, frame, end_geopose, wp_dist)
+
+
+def pixel_path_to_waypoints(path_pixels, transform, frame, end_geopose, wp_dist):
+    """
+    Converts a pixel path to an evenly spaced WaypointPath (ending exactly at end_geopose)
+    """
+
+    # Downsample the path to evenly spaced waypoints first, so we only convert the ones we keep
+    num_points = len(path_pixels)
+    selected_indices = [0]
+    if num_points >= 2:
+        selected_indices = downsample_points(num_points, wp_dist)
+    selected_pixels = np.asarray([path_pixels[i] for i in selected_indices], dtype=np.float64)
+
+    # Pixel centers to UTM to GPS (the last waypoint is always the end location itself)
+    rows, cols = selected_pixels[:, 0] + 0.5, selected_pixels[:, 1] + 0.5
+    utm_x = transform.a * cols + transform.b * rows + transform.c
+    utm_y = transform.d * cols + transform.e * rows + transform.f
+    lats, lons = frame.zone.to_latlon_array(utm_x, utm_y)
+    end_lat, end_lon, end_yaw = geopose2LatLonYaw(end_geopose)
+    lats[-1], lons[-1] = end_lat, end_lon
+    utm_x[-1], utm_y[-1] = frame.latlon_to_utm(end_lat, end_lon)
+    yaws = np.zeros(len(lats))
+    yaws[-1] = end_yaw
+    return WaypointPath(lats, lons, yaws, utm_x, utm_y)
+
+
+def terrainHexPlanner(start_geopose, hex_geoposes, wp_dist, elev_cost, elev_limit, roll_cost, roll_limit, window_padding=20.0, frame=None):
+    """
+    Plan terrain paths between all the hex search points of a leg in one pass
+
+    Reads one window around the start and every hex point (padded by window_padding meters, or the
+    whole map if it's 0) and computes its edge costs once, then runs a single multi-goal Dijkstra sweep from the start and
+    from each hex point to all the hex points after it.
+
+    Returns paths, where paths[i][j] is the WaypointPath to hex point j from the start
+    (i = 0) or from hex point i - 1 (i > 0), or None if there's no path.
+    """
+
+    map_cache = get_map_cache()
+    if frame is None:
+        frame = MissionFrame.from_geopose(start_geopose)
+
+    geotiff_file = map_cache.find_map(start_geopose, start_geopose, frame)
+    if not geotiff_file:
+        raise Exception("No viable map found for terrain-based planning")
+    transform, height, width = map_cache.map_index.footprint(geotiff_file)
+
+    start_pixel = geopose_to_pixel(start_geopose, transform, frame)
+    hex_pixels = [geopose_to_pixel(gp, transform, frame) for gp in hex_geoposes]
+    for row, col in hex_pixels:
+        if not (0 <= row < height and 0 <= col < width):
+            raise Exception("Hex search points aren't all on the same map")
+
+    # One shared window and edge cost grid for every sweep
+    if window_padding > 0:
+        padding = int(math.ceil(window_padding / abs(transform.a)))
+        window = bounding_window([start_pixel] + hex_pixels, padding, height, width)
+    else:
+        window = Window(0, 0, width, height)
+    terrain_graph = map_cache.get_window_graph(
+        geotiff_file, window, elev_cost, elev_limit, roll_cost, roll_limit, True
+    )
+    offset = (window.row_off, window.col_off)
+    sources = [start_pixel] + hex_pixels[:-1]
+
+    paths = []
+    for i, source in enumerate(sources):
+        goals = hex_pixels[i:]
+        window_paths = multi_goal_dijkstra(
+            terrain_graph.edge_costs,
+            (source[0] - offset[0], source[1] - offset[1]),
+            [(row - offset[0], col - offset[1]) for row, col in goals],
+        )
+
+        leg_paths = [None] * len(hex_pixels)
+        for j, window_path in enumerate(window_paths, start=i):
+            if window_path:
+                path_pixels = [(row + offset[0], col + offset[1]) for row, col in window_path]
+                leg_paths[j] = pixel_path_to_waypoints(path_pixels, transform, frame, hex_geoposes[j], wp_dist)
+        paths.append(leg_paths)
+    return paths
@@ -25,6 +25,7 @@ setup(
     entry_points={
         'console_scripts': [
             'state_machine = rover_navigation.state_machine:main',
+            'precompute_terrain_costs = rover_navigation.precompute_terrain_costs:main',
         ],
     },
 )
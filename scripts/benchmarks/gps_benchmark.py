@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the gps_utils fast paths (rover_navigation/utils/gps_utils.py).
+
+Compares the cached UtmZone conversions and the LocalTangentPlane (ENU) projection against calling
+the utm library directly (what latLon2Meters and meters2LatLon used to do), and checks that they
+agree. Run it from inside the Docker container with the rover_ws workspace sourced.
+
+Usage:
+  python3 gps_benchmark.py
+  python3 gps_benchmark.py --lat 38.4 --lon -110.8 --points 100000
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+import utm
+
+from rover_navigation.utils.gps_utils import LocalTangentPlane, get_utm_zone
+
+
+def utm_distance(lat1, lon1, lat2, lon2):
+    """
+    The old latLon2Meters (a full utm library round trip for both points).
+    """
+
+    utm1 = utm.from_latlon(lat1, lon1)
+    utm2 = utm.from_latlon(lat2, lon2)
+    return ((utm2[0] - utm1[0]) ** 2 + (utm2[1] - utm1[1]) ** 2) ** 0.5
+
+
+def zone_distance(lat1, lon1, lat2, lon2):
+    """
+    latLon2Meters with the cached UtmZone fast path.
+    """
+
+    east1, north1 = get_utm_zone(lat1, lon1).from_latlon(lat1, lon1)
+    east2, north2 = get_utm_zone(lat2, lon2).from_latlon(lat2, lon2)
+    return math.hypot(east2 - east1, north2 - north1)
+
+
+def time_it(name, func, repeat):
+    """
+    Times repeat calls of func and prints the time per call.
+    """
+
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = time.perf_counter() - t0
+    print(f"{name:>28}: {elapsed / repeat * 1e6:9.2f} us/call")
+    return result, elapsed / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the gps_utils fast paths.")
+    parser.add_argument("--lat", type=float, default=40.2497, help="Mission origin latitude.")
+    parser.add_argument("--lon", type=float, default=-111.6493, help="Mission origin longitude.")
+    parser.add_argument("--points", type=int, default=10000, help="Points for the array conversions.")
+    parser.add_argument("--repeat", type=int, default=20000, help="Calls for the scalar conversions.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = args.lat + rng.uniform(-0.01, 0.01, args.points)
+    lons = args.lon + rng.uniform(-0.01, 0.01, args.points)
+    lat2, lon2 = float(lats[0]), float(lons[0])
+    zone = get_utm_zone(args.lat, args.lon)
+    plane = LocalTangentPlane(args.lat, args.lon)
+    ok = True
+
+    print("Scalar distance (latLon2Meters):")
+    base, base_time = time_it("utm library", lambda: utm_distance(args.lat, args.lon, lat2, lon2), args.repeat)
+    fast, fast_time = time_it("UtmZone", lambda: zone_distance(args.lat, args.lon, lat2, lon2), args.repeat)
+    enu, enu_time = time_it(
+        "LocalTangentPlane", lambda: math.hypot(*plane.to_enu(lat2, lon2)[:2]), args.repeat
+    )
+    ok = ok and math.isclose(base, fast, abs_tol=1e-6)
+    print(f"{'speedup':>28}: UtmZone {base_time / fast_time:5.1f}x, ENU {base_time / enu_time:5.1f}x")
+    print(f"{'difference':>28}: UtmZone {abs(base - fast):.2e} m, ENU {abs(base - enu):.2e} m (UTM scale)")
+
+    print("Scalar inverse (meters2LatLon):")
+    east, north = zone.from_latlon(lat2, lon2)
+    base, base_time = time_it(
+        "utm library", lambda: utm.to_latlon(east, north, zone.zone_number, zone.zone_letter), args.repeat
+    )
+    fast, fast_time = time_it("UtmZone", lambda: zone.to_latlon(east, north), args.repeat)
+    ok = ok and np.allclose(base, fast, rtol=0.0, atol=1e-9)
+    print(f"{'speedup':>28}: {base_time / fast_time:5.1f}x")
+
+    print(f"Arrays ({args.points} points):")
+    base, base_time = time_it(
+        "utm library (per point)",
+        lambda: [utm.from_latlon(lat, lon)[:2] for lat, lon in zip(lats.tolist(), lons.tolist())],
+        1,
+    )
+    fast, fast_time = time_it("UtmZone.from_latlon_array", lambda: zone.from_latlon_array(lats, lons), 10)
+    enu, enu_time = time_it("LocalTangentPlane.to_enu_array", lambda: plane.to_enu_array(lats, lons), 10)
+    ok = ok and np.allclose(np.asarray(base).T, np.asarray(fast), rtol=0.0, atol=1e-6)
+    print(f"{'speedup':>28}: UtmZone {base_time / fast_time:5.1f}x, ENU {base_time / enu_time:5.1f}x")
+
+    # The ENU round trip should be exact (to well under a millimeter)
+    back_lats, back_lons, _ = plane.from_enu_array(*enu)
+    error = np.max(np.hypot(*plane.to_enu_array(back_lats, back_lons)[:2]) - np.hypot(*enu[:2]))
+    ok = ok and abs(error) < 1e-3
+    print(f"{'ENU round trip error':>28}: {abs(error):.2e} m")
+
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the search pattern planner (rover_navigation/utils/search_utils.py).
+
+Drops simulated targets around a leg waypoint and measures how far the rover drives along each
+search pattern before the target comes within detection range (the spin search at the waypoint
+sees the center first). Compares the fixed hex_coord tables from the state machine against the
+generated patterns. Run it from inside the Docker container with the rover_ws workspace sourced.
+
+Usage:
+  python3 search_benchmark.py
+  python3 search_benchmark.py --targets 50000 --range 4.0 --distribution uniform
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from rover_navigation.utils.search_utils import searchPatternPlanner, search_coverage
+
+# The fixed search patterns from the state machine (tuned for a 5m detection range)
+HEX_COORD_ARUCO = [
+    (4.5, 7.79),
+    (9.0, 0.0),
+    (4.5, -7.79),
+    (-4.5, -7.79),
+    (-9.0, 0.0),
+    (-4.5, 7.79),
+    (0.0, 15.58),
+    (13.5, 7.79),
+    (13.5, -7.79),
+    (0.0, -15.58),
+    (-13.5, -7.79),
+    (-13.5, 7.79),
+]
+HEX_COORD_OBJ = HEX_COORD_ARUCO[:6]
+
+
+def sample_targets(count, radius, distribution, rng):
+    """
+    Samples target positions inside the search circle (Gaussian around the center, or uniform).
+    """
+
+    targets = np.empty((0, 2))
+    while len(targets) < count:
+        if distribution == "uniform":
+            points = rng.uniform(-radius, radius, (count, 2))
+        else:
+            points = rng.normal(0.0, radius / 2.0, (count, 2))
+        points = points[np.hypot(points[:, 0], points[:, 1]) <= radius]
+        targets = np.vstack((targets, points))
+    return targets[:count]
+
+
+def detection_distances(pattern, targets, detect_range):
+    """
+    Distance driven along the pattern (from the center) until each target is within detection
+    range, or inf if it's never seen. Targets within range of the center are seen by the spin.
+    """
+
+    distances = np.full(len(targets), np.inf)
+    distances[np.hypot(targets[:, 0], targets[:, 1]) <= detect_range] = 0.0
+    driven = 0.0
+    start = np.zeros(2)
+    for point in pattern:
+        end = np.asarray(point, dtype=np.float64)
+        seg = end - start
+        seg_len = math.hypot(seg[0], seg[1])
+
+        # First point along the segment within range of each target (smallest root of |a + t*d - p| = r)
+        rel = start - targets
+        b = rel @ seg
+        c = (rel**2).sum(axis=1) - detect_range**2
+        disc = b**2 - seg_len**2 * c
+        hit = (disc >= 0) & np.isinf(distances)
+        t = np.clip((-b[hit] - np.sqrt(disc[hit])) / seg_len**2, 0.0, None)
+        valid = t <= 1.0
+        hit_idx = np.flatnonzero(hit)[valid]
+        distances[hit_idx] = driven + t[valid] * seg_len
+
+        driven += seg_len
+        start = end
+    return distances, driven
+
+
+def report(name, pattern, targets, radius, detect_range):
+    """
+    Prints the time-to-detection stats (in meters driven) for one pattern. The expected distance
+    counts a missed target as driving the whole pattern (then the leg is given up on).
+    """
+
+    distances, length = detection_distances(pattern, targets, detect_range)
+    found = np.isfinite(distances)
+    expected = np.where(found, distances, length).mean()
+    coverage = search_coverage(pattern, radius, detect_range)
+    print(
+        f"{name:>24}: {len(pattern):2d} pts  length {length:6.1f}m  coverage {coverage:6.1%}  "
+        f"found {found.mean():6.1%}  expected {expected:5.1f}m  "
+        f"median {np.median(distances[found]):5.1f}m  p90 {np.percentile(distances[found], 90):5.1f}m"
+    )
+    return found.mean(), expected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the search pattern planner.")
+    parser.add_argument("--targets", type=int, default=20000, help="Simulated target positions.")
+    parser.add_argument("--range", type=float, default=5.0, help="Detection range (in meters).")
+    parser.add_argument(
+        "--distribution", choices=["gaussian", "uniform"], default="gaussian", help="Target distribution."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ok = True
+    for leg_type, radius, table in (("aruco", 20.0, HEX_COORD_ARUCO), ("obj", 10.0, HEX_COORD_OBJ)):
+        targets = sample_targets(args.targets, radius, args.distribution, rng)
+        print(f"{leg_type} ({radius:.0f}m radius, {args.range:.1f}m range, {args.distribution} targets):")
+        table_found, table_expected = report("fixed hex_coord table", table, targets, radius, args.range)
+        for heading in (0.0, math.pi / 2, 3 * math.pi / 4):
+            t0 = time.perf_counter()
+            pattern = searchPatternPlanner(radius, args.range, heading)
+            elapsed = time.perf_counter() - t0
+            found, expected = report(f"generated ({math.degrees(heading):.0f} deg)", pattern, targets, radius, args.range)
+            print(f"{'':>24}  planned in {elapsed * 1000:.1f}ms")
+
+            # The generated patterns should find at least as many targets, just as fast
+            ok = ok and found >= table_found - 1e-3 and expected <= table_expected * 1.05
+
+    # Long detection ranges for the radius leave no hex lattice points inside the circle, the
+    # planner should still return a pattern that covers most of the circle (not crash)
+    for radius, detect_range in ((10.0, 6.0), (10.0, 5.6), (10.0, 9.0), (10.0, 12.0), (3.0, 5.0)):
+        pattern = searchPatternPlanner(radius, detect_range)
+        coverage = search_coverage(pattern, radius, detect_range)
+        print(f"{radius:.0f}m radius, {detect_range:.1f}m range: {len(pattern)} pts  coverage {coverage:6.1%}")
+        ok = ok and coverage >= 0.9
+
+    print("OK" if ok else "WORSE")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the terrain-based A* planner (rover_navigation/utils/terrain_utils.py).
+
+Runs the same leg through each TerrainGraph mode on a large DEM and checks that they find paths
+with the same cost. Then runs random plan/move start/shift goal/update_costs steps through the
+IncrementalTerrainPlanner and checks every path costs the same as a fresh grid_astar search.
+Run it from inside the Docker container with the rover_ws workspace sourced.
+
+Usage:
+  python3 terrain_benchmark.py                      # synthetic 2000x2000 DEM
+  python3 terrain_benchmark.py --map byu_campus.tif  # a real GeoTIFF map
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+import numpy as np
+import rasterio
+
+from rover_navigation.utils.terrain_utils import (
+    DIRECTION_INDEX,
+    IncrementalTerrainPlanner,
+    TerrainGraph,
+    compute_edge_costs,
+    grid_astar,
+)
+
+
+def synthetic_dem(size, seed):
+    """
+    Generates rolling terrain (in meters, 1m pixels) with a few steep ridges to route around.
+    """
+
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:size, 0:size].astype(np.float64)
+    dem = np.zeros((size, size))
+    for _ in range(12):
+        freq = rng.uniform(0.002, 0.02)
+        phase = rng.uniform(0, 2 * math.pi, 2)
+        amp = rng.uniform(1.0, 6.0)
+        dem += amp * np.sin(freq * rows + phase[0]) * np.cos(freq * cols + phase[1])
+    dem += rng.normal(0.0, 0.05, (size, size))
+    return dem.astype(np.float32)
+
+
+def path_cost(graph, path):
+    """
+    Sums the edge costs along a path using the (unmodified) per-edge cost function.
+    """
+
+    reference = TerrainGraph(
+        graph.elevation_data,
+        graph.transform,
+        graph.elev_cost,
+        graph.elev_limit,
+        graph.roll_cost,
+        graph.roll_limit,
+    )
+    return sum(reference.distance_between(a, b) for a, b in zip(path, path[1:]))
+
+
+def grid_path_cost(edge_costs, path):
+    """
+    Sums the edge costs along a path from a compute_edge_costs grid (None for no path).
+    """
+
+    if not path:
+        return None
+    return sum(
+        float(edge_costs[a[0], a[1], DIRECTION_INDEX[(b[0] - a[0], b[1] - a[1])]]) for a, b in zip(path, path[1:])
+    )
+
+
+def incremental_check(elevation_data, params, steps, size, seed):
+    """
+    Runs random steps through the IncrementalTerrainPlanner on a size x size crop of the DEM and
+    checks each path against a fresh grid_astar search. Returns the number of mismatches.
+    """
+
+    rng = random.Random(seed)
+    rows, cols = elevation_data.shape
+    size = min(size, rows, cols)
+    row0, col0 = (rows - size) // 2, (cols - size) // 2
+    elevation = np.array(elevation_data[row0 : row0 + size, col0 : col0 + size], dtype=np.float64)
+    edge_costs = compute_edge_costs(elevation, *params)
+    planner = IncrementalTerrainPlanner(edge_costs)
+
+    def clip(pixel):
+        return min(size - 1, max(0, pixel[0])), min(size - 1, max(0, pixel[1]))
+
+    start, goal = (size // 2, size // 2), (size * 2 // 3, size * 3 // 4)
+    mismatches = 0
+    inc_time = grid_time = 0.0
+    for step in range(steps):
+        action = rng.random()
+        if action < 0.4:
+            # Shift the goal a little (like a moving hex point or found target)
+            goal = clip((goal[0] + rng.randint(-5, 5), goal[1] + rng.randint(-5, 5)))
+        elif action < 0.7:
+            # Move the start a few pixels along the last path (like driving it)
+            path = planner.plan(start, goal)
+            if path and len(path) > 3:
+                start = path[3]
+        elif action < 0.85:
+            # Raise a small patch of terrain (like a cost map update)
+            row, col = rng.randint(0, size - 8), rng.randint(0, size - 8)
+            elevation = elevation.copy()
+            elevation[row : row + 8, col : col + 8] += 5.0
+            edge_costs = compute_edge_costs(elevation, *params)
+            planner.update_costs(edge_costs)
+        else:
+            # Jump the goal somewhere else entirely
+            goal = (rng.randrange(size), rng.randrange(size))
+
+        t0 = time.perf_counter()
+        inc_cost = grid_path_cost(edge_costs, planner.plan(start, goal))
+        t1 = time.perf_counter()
+        grid_cost = grid_path_cost(edge_costs, grid_astar(edge_costs, start, goal))
+        t2 = time.perf_counter()
+        inc_time += t1 - t0
+        grid_time += t2 - t1
+
+        if inc_cost is None or grid_cost is None:
+            match = inc_cost is None and grid_cost is None
+        else:
+            match = math.isclose(inc_cost, grid_cost, rel_tol=1e-9, abs_tol=1e-9)
+        if not match:
+            mismatches += 1
+            print(f"  step {step}: incremental cost {inc_cost} != grid_astar cost {grid_cost}")
+
+    print(
+        f"incremental: {steps} steps on a {size}x{size} crop, {mismatches} mismatches  "
+        f"(incremental {inc_time:.3f}s, grid_astar {grid_time:.3f}s)"
+    )
+    return mismatches
+
+
+def run_mode(name, make_graph, start, goal, grid_search=False, mode="standard"):
+    """
+    Times building the graph and running A* for one planner mode.
+    """
+
+    t0 = time.perf_counter()
+    graph = make_graph()
+    t1 = time.perf_counter()
+    path = graph.find_path(start, goal, grid_search, mode)
+    t2 = time.perf_counter()
+    path = list(path) if path else []
+    print(f"{name:>12}: setup {t1 - t0:7.3f}s  search {t2 - t1:7.3f}s  total {t2 - t0:7.3f}s  ({len(path)} px)")
+    return graph, path, t2 - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the terrain-based A* planner modes.")
+    parser.add_argument("--map", type=str, default=None, help="GeoTIFF map to plan over (default: synthetic).")
+    parser.add_argument("--size", type=int, default=2000, help="Synthetic DEM size in pixels (default: 2000).")
+    parser.add_argument("--leg", type=int, default=600, help="Leg length along each axis in pixels (default: 600).")
+    parser.add_argument("--seed", type=int, default=0, help="Synthetic DEM random seed (default: 0).")
+    parser.add_argument("--elevation_cost", type=float, default=1.0)
+    parser.add_argument("--elevation_limit", type=float, default=0.7)
+    parser.add_argument("--roll_cost", type=float, default=0.2)
+    parser.add_argument("--roll_limit", type=float, default=1.4)
+    parser.add_argument("--incremental_steps", type=int, default=240, help="Random incremental planner steps.")
+    parser.add_argument("--incremental_size", type=int, default=300, help="DEM crop for the incremental check.")
+    args = parser.parse_args()
+
+    if args.map:
+        with rasterio.open(args.map) as src:
+            elevation_data = src.read(1)
+            transform = src.transform
+    else:
+        elevation_data = synthetic_dem(args.size, args.seed)
+        transform = None
+
+    rows, cols = elevation_data.shape
+    leg = min(args.leg, rows - 2, cols - 2)
+    start = ((rows - leg) // 2, (cols - leg) // 2)
+    goal = (start[0] + leg, start[1] + leg)
+    params = (args.elevation_cost, args.elevation_limit, args.roll_cost, args.roll_limit)
+    print(f"DEM {rows}x{cols}, planning {start} -> {goal}")
+
+    results = {}
+    results["baseline"] = run_mode(
+        "baseline", lambda: TerrainGraph(elevation_data, transform, *params), start, goal
+    )
+    results["precompute"] = run_mode(
+        "precompute", lambda: TerrainGraph(elevation_data, transform, *params, precompute=True), start, goal
+    )
+    results["pyramid"] = run_mode(
+        "pyramid", lambda: TerrainGraph(elevation_data, transform, *params), start, goal, mode="pyramid"
+    )
+
+    # Every mode should find an optimal path, except pyramid (which only has to be close)
+    base_graph, base_path, base_time = results["baseline"]
+    base_cost = path_cost(base_graph, base_path) if base_path else math.inf
+    ok = True
+    for name, (graph, path, elapsed) in results.items():
+        cost = path_cost(graph, path) if path else math.inf
+        rel_tol = 0.05 if name == "pyramid" else 1e-9
+        match = math.isclose(cost, base_cost, rel_tol=rel_tol) or cost == base_cost
+        ok = ok and match
+        print(f"{name:>12}: cost {cost:10.3f}  speedup {base_time / elapsed:5.2f}x  {'OK' if match else 'MISMATCH'}")
+
+    # The incremental planner has to match a fresh search after every kind of change
+    if args.incremental_steps > 0:
+        ok = incremental_check(elevation_data, params, args.incremental_steps, args.incremental_size, args.seed) == 0 and ok
+
+    sys.exit(0 if ok else 1)